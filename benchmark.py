@@ -0,0 +1,196 @@
+"""
+Benchmarks for the engine hot paths over a fixed corpus of positions.
+
+Each configuration is timed over the whole corpus (best of a few repeats),
+then run once more under tracemalloc for its memory use. Results can be
+saved as JSON and compared against a saved baseline:
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --baseline baseline.json
+
+The comparison exits with status 1 when a configuration got slower than
+the tolerance allows or searched more nodes than before.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import tictactoe as ttt
+from tictactoe import X, O, EMPTY as _
+
+# Positions with a single right answer: wins, blocks and forks
+TACTICAL = [
+    [[X, X, _], [O, O, _], [_, _, _]],
+    [[X, _, _], [_, O, _], [_, _, X]],
+    [[O, _, _], [_, X, _], [_, _, X]],
+    [[X, O, X], [_, O, _], [_, _, _]],
+    [[X, _, O], [_, _, _], [O, _, X]],
+    [[_, _, _], [X, O, O], [_, X, _]],
+]
+
+TOLERANCE = 0.10
+
+
+def corpus():
+    """The empty board, every first move, every reply to it and the tactical positions"""
+    boards = [ttt.initial_state()]
+    for first in ttt.actions(boards[0]):
+        board = ttt.result(boards[0], first)
+        boards.append(board)
+        for second in ttt.actions(board):
+            boards.append(ttt.result(board, second))
+    boards.extend(TACTICAL)
+    return boards
+
+
+def _search(**options):
+    def run(boards, warm=False):
+        nodes = 0
+        for board in boards:
+            if not warm:
+                ttt.TRANSPOSITION_TABLE.clear()
+            info = ttt.SearchInfo()
+            ttt.minimax(board, info=info, **options)
+            nodes += info.nodes
+        return nodes
+    return run
+
+
+def _warm(run):
+    def warm(boards):
+        ttt.TRANSPOSITION_TABLE.clear()
+        return run(boards, warm=True)
+    return warm
+
+
+def _primitive(function, rounds=50, cached=False):
+    """
+    Times function over the boards. Boards keep their game state once it is
+    built, so unless cached is True the function gets plain-list copies and
+    evaluates every board each time.
+    """
+    def run(boards):
+        if not cached:
+            boards = [[list(row) for row in board] for board in boards]
+        for _round in range(rounds):
+            for board in boards:
+                function(board)
+        return None
+    return run
+
+
+def _result(board):
+    moves = ttt.actions(board)
+    if not isinstance(moves, str):
+        for action in moves:
+            ttt.result(board, action)
+
+
+CONFIGURATIONS = {
+    "minimax": _search(),
+    "minimax-warm": _warm(_search()),
+    "minimax-unordered": _search(ordering=False),
+    "minimax-budget": _search(max_nodes=200),
+    "result": _primitive(_result, rounds=10),
+    "result-cached": _primitive(_result, rounds=10, cached=True),
+    "terminal": _primitive(ttt.terminal),
+    "terminal-cached": _primitive(ttt.terminal, cached=True),
+    "winner": _primitive(ttt.winner),
+    "winner-cached": _primitive(ttt.winner, cached=True),
+}
+
+
+def measure(run, boards, repeat=3):
+    """Returns wall time, nodes and memory use of one configuration"""
+    best = None
+    for _repeat in range(repeat):
+        started = time.perf_counter()
+        nodes = run(boards)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    ttt.TRANSPOSITION_TABLE.clear()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        run(boards)
+        after = tracemalloc.take_snapshot()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    retained = after.compare_to(before, "filename")
+
+    return {
+        "wall_s": best,
+        "nodes": nodes,
+        "positions": len(boards),
+        "peak_kib": peak / 1024,
+        "retained_kib": sum(stat.size_diff for stat in retained) / 1024,
+        "retained_blocks": sum(stat.count_diff for stat in retained),
+    }
+
+
+def run_benchmarks(names=None, repeat=3):
+    boards = corpus()
+    results = {}
+    for name, run in CONFIGURATIONS.items():
+        if names and name not in names:
+            continue
+        results[name] = measure(run, boards, repeat)
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance=TOLERANCE):
+    """Returns a list of regression messages, empty when none were found"""
+    regressions = []
+    for name, now in current["results"].items():
+        then = baseline["results"].get(name)
+        if then is None:
+            continue
+        if now["wall_s"] > then["wall_s"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: {now['wall_s']:.4f}s, was {then['wall_s']:.4f}s "
+                f"({now['wall_s'] / then['wall_s'] - 1:+.0%})")
+        if now["nodes"] is not None and then["nodes"] is not None and now["nodes"] > then["nodes"]:
+            regressions.append(f"{name}: {now['nodes']} nodes, was {then['nodes']}")
+    return regressions
+
+
+def report(current, out=sys.stdout):
+    print(f"{'configuration':<20}{'wall (ms)':>12}{'nodes':>10}{'peak (KiB)':>12}"
+          f"{'retained':>10}", file=out)
+    for name, result in current["results"].items():
+        nodes = "-" if result["nodes"] is None else result["nodes"]
+        print(f"{name:<20}{result['wall_s'] * 1000:>12.2f}{nodes:>10}"
+              f"{result['peak_kib']:>12.1f}{result['retained_blocks']:>10}", file=out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the tic-tac-toe engine.")
+    parser.add_argument("configurations", nargs="*", help=f"any of {', '.join(CONFIGURATIONS)}")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="allowed slowdown before a time counts as a regression")
+    options = parser.parse_args()
+
+    current = run_benchmarks(options.configurations, options.repeat)
+    report(current)
+    if options.save:
+        with open(options.save, "w") as f:
+            json.dump(current, f, indent=2)
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare(current, json.load(f), options.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,258 @@
+"""
+Opening book and endgame cache, two tiers in front of minimax.
+
+The opening book is built offline by self-play: positions up to max_ply
+plies deep are searched once and their moves written to a file, which is
+loaded at startup. Games mostly follow the book's own moves, with a random
+move now and then so that the book also covers what an opponent may play.
+
+PositionCache puts the book in front of a bounded cache of solved
+positions, dropped least recently used first once they pass a memory cap.
+Pass it to minimax as table=: positions are looked up before searching,
+and every search minimax finishes is stored. Positions are keyed up to
+rotation and reflection, as in the transposition table.
+
+    python book.py build 4 --ply 4 --games 200
+    python book.py show book-4x4-4.bin
+"""
+
+import argparse
+import collections
+import json
+import random
+import struct
+import sys
+
+import tictactoe as ttt
+
+MAGIC = b"TTTB"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBI")
+# Value of a book move that a search budget left unresolved
+UNKNOWN = 127
+NO_MOVE = 255
+
+# Bytes an entry costs in an OrderedDict beyond its key and value objects
+ENTRY_OVERHEAD = 112
+
+
+def default_path(size=3, k=None):
+    geometry = ttt.get_geometry(size, k)
+    return f"book-{geometry.size}x{geometry.size}-{geometry.k}.bin"
+
+
+def _record_struct(geometry):
+    """The struct of one book entry: canonical key, value, move cell and distance"""
+    return struct.Struct(f"<{(2 * geometry.cells + 7) // 8}sbBB")
+
+
+def _oriented(geometry, entry, symmetry):
+    """(value, action, distance) of an entry whose move is in canonical orientation"""
+    value, cell, distance = entry
+    if cell is not None:
+        cell = geometry.inverse_symmetries[symmetry][cell]
+    return value, None if cell is None else divmod(cell, geometry.size), distance
+
+
+class OpeningBook:
+    """
+    Moves of the opening positions of one geometry. entries maps canonical
+    keys to (value, cell, distance); value is None when the search that
+    chose the move ran out of budget before the result was known.
+    """
+
+    def __init__(self, geometry=ttt.DEFAULT_GEOMETRY, entries=None):
+        self.geometry = geometry
+        self.entries = {} if entries is None else entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, state):
+        """Returns (value, action, distance) for the state, or None if it is not in the book"""
+        if state.geometry is not self.geometry:
+            return None
+        key, symmetry = self.geometry.canonical_key(state.x, state.o)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        return _oriented(self.geometry, entry, symmetry)
+
+    def add(self, state, value, action, distance):
+        key, symmetry = self.geometry.canonical_key(state.x, state.o)
+        cell = self.geometry.symmetries[symmetry][action[0] * self.geometry.size + action[1]]
+        self.entries[key] = (value, cell, distance)
+
+    @classmethod
+    def build(cls, size=3, k=None, max_ply=4, games=100, explore=0.3, time_limit=1.0, seed=0):
+        """
+        Builds a book from games of self-play, searching every position met
+        in the first max_ply plies for up to time_limit seconds. Each move
+        is a random one with probability explore, so games branch off.
+        """
+        book = cls(ttt.get_geometry(size, k))
+        rng = random.Random(seed)
+        for _game in range(games):
+            board = ttt.initial_state(size, k)
+            for _ply in range(max_ply):
+                if ttt.terminal(board):
+                    break
+                state = ttt.game_state(board)
+                solved = book.lookup(state)
+                if solved is None:
+                    info = ttt.SearchInfo()
+                    action = ttt.minimax(board, time_limit=time_limit, info=info)
+                    if info.completed:
+                        book.add(state, info.value, action, info.distance)
+                    else:
+                        # Only how deep the search got is known
+                        book.add(state, None, action, info.depth)
+                else:
+                    action = solved[1]
+                if rng.random() < explore:
+                    action = rng.choice(sorted(ttt.actions(board)))
+                board = ttt.result(board, action)
+        return book
+
+    def save(self, path):
+        geometry = self.geometry
+        record = _record_struct(geometry)
+        width = record.size - 3
+        with open(path, "wb") as handle:
+            handle.write(HEADER.pack(MAGIC, VERSION, geometry.size, geometry.k, len(self.entries)))
+            for key, (value, cell, distance) in self.entries.items():
+                handle.write(record.pack(key.to_bytes(width, "little"),
+                                         UNKNOWN if value is None else value,
+                                         NO_MOVE if cell is None else cell, distance))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as handle:
+            data = handle.read()
+        magic, version, size, k, count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not an opening book")
+        geometry = ttt.get_geometry(size, k)
+        record = _record_struct(geometry)
+        if len(data) != HEADER.size + count * record.size:
+            raise ValueError(f"{path} is truncated")
+        entries = {}
+        for key, value, cell, distance in record.iter_unpack(data[HEADER.size:]):
+            entries[int.from_bytes(key, "little")] = (
+                None if value == UNKNOWN else value, None if cell == NO_MOVE else cell, distance)
+        return cls(geometry, entries)
+
+
+class PositionCache:
+    """
+    An opening book in front of an LRU cache of solved positions, for
+    minimax's table argument. The cache holds up to about max_bytes of
+    entries, and only positions with at most max_empties empty cells when
+    that is given. book_hits, hits and misses count lookups.
+    """
+
+    def __init__(self, book=None, max_bytes=16 << 20, max_empties=None):
+        self.book = book
+        self.max_bytes = max_bytes
+        self.max_empties = max_empties
+        self.entries = collections.OrderedDict()
+        self.bytes = 0
+        self.book_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, state):
+        """Returns (value, action, distance) for the state, or None on a miss"""
+        if self.book is not None:
+            solved = self.book.lookup(state)
+            if solved is not None:
+                self.book_hits += 1
+                return solved
+        geometry = state.geometry
+        canonical, symmetry = geometry.canonical_key(state.x, state.o)
+        key = (geometry, canonical)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return _oriented(geometry, entry, symmetry)
+
+    def store(self, state, value, action, distance):
+        """Keeps the result of a finished search of state"""
+        geometry = state.geometry
+        if self.max_empties is not None and geometry.cells - state.count > self.max_empties:
+            return
+        canonical, symmetry = geometry.canonical_key(state.x, state.o)
+        key = (geometry, canonical)
+        entry = (value, geometry.symmetries[symmetry][action[0] * geometry.size + action[1]],
+                 distance)
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.bytes -= self._size(key, previous)
+        self.entries[key] = entry
+        self.bytes += self._size(key, entry)
+        while self.bytes > self.max_bytes and self.entries:
+            old_key, old_entry = self.entries.popitem(last=False)
+            self.bytes -= self._size(old_key, old_entry)
+            self.evictions += 1
+
+    @staticmethod
+    def _size(key, entry):
+        return sys.getsizeof(key) + sys.getsizeof(key[1]) + sys.getsizeof(entry) + ENTRY_OVERHEAD
+
+    def stats(self):
+        """Counters for monitoring"""
+        lookups = self.book_hits + self.hits + self.misses
+        return {
+            "book": 0 if self.book is None else len(self.book),
+            "cached": len(self.entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "book_hits": self.book_hits,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.book_hits + self.hits) / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+        self.book_hits = self.hits = self.misses = self.evictions = 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or show an opening book.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build")
+    build.add_argument("size", type=int)
+    build.add_argument("k", nargs="?", type=int, default=None)
+    build.add_argument("--ply", type=int, default=4, help="deepest ply the book covers")
+    build.add_argument("--games", type=int, default=100, help="self-play games")
+    build.add_argument("--explore", type=float, default=0.3,
+                       help="chance of a random move, so games branch off")
+    build.add_argument("--time", type=float, default=1.0, help="seconds of search per position")
+    build.add_argument("--seed", type=int, default=0)
+    build.add_argument("--out", default=None)
+    show = commands.add_parser("show")
+    show.add_argument("path")
+    options = parser.parse_args()
+
+    if options.command == "build":
+        book = OpeningBook.build(options.size, options.k, options.ply, options.games,
+                                 options.explore, options.time, options.seed)
+        path = options.out or default_path(options.size, options.k)
+        book.save(path)
+        print(f"Wrote {len(book)} positions to {path}")
+    else:
+        book = OpeningBook.load(options.path)
+        values = collections.Counter(value for value, _cell, _distance in book.entries.values())
+        print(json.dumps({"geometry": repr(book.geometry), "positions": len(book),
+                          "values": {str(value): count for value, count in values.items()}},
+                         indent=2))
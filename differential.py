@@ -0,0 +1,212 @@
+"""
+Differential check of the exact engines against a reference solution.
+
+Every reachable 3x3 position is solved backwards from the full boards
+(solutions.solve) as the reference: its value, and the plies to the end
+of the game when the winner takes the fastest win and the loser the
+slowest loss. Each registered engine is run on every unfinished position
+and must report the same value and distance when it reports them at all.
+Its move must keep both, the position it leads to having the same value
+one ply closer to the end. Engines may differ only in which of several
+equally good moves they pick.
+
+The same run times each engine over all the positions.
+
+    python differential.py                 every engine
+    python differential.py minimax parallel
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import book
+import solutions
+import tictactoe as ttt
+
+ENGINES = {}
+
+
+def register(name):
+    """
+    Registers an engine under a name. The decorated function is called
+    once per run and returns solve(board) -> (action, value, distance),
+    with value and distance None where the engine does not report them.
+    """
+    def decorate(factory):
+        ENGINES[name] = factory
+        return factory
+    return decorate
+
+
+def _minimax(**options):
+    def factory():
+        ttt.TRANSPOSITION_TABLE.clear()
+
+        def solve(board):
+            info = ttt.SearchInfo()
+            action = ttt.minimax(board, info=info, **options)
+            return action, info.value, info.distance
+        return solve
+    return factory
+
+
+register("minimax")(_minimax())
+register("minimax-unordered")(_minimax(ordering=False))
+# Iterative deepening under a budget it never runs out of
+register("minimax-budget")(_minimax(time_limit=60))
+register("parallel")(_minimax(processes=2))
+
+
+@register("minimax-tree")
+def _recorded_tree():
+    ttt.TRANSPOSITION_TABLE.clear()
+
+    def solve(board):
+        action, tree = ttt.minimax(board, record_tree=True)
+        value, selected_depth = tree.result(0)
+        return action, value, selected_depth
+    return solve
+
+
+@register("position-cache")
+def _position_cache():
+    ttt.TRANSPOSITION_TABLE.clear()
+    # Every position is asked for once, so answers come from positions
+    # cached by symmetric twins
+    return _minimax(table=book.PositionCache())()
+
+
+@register("solve-many")
+def _solve_many():
+    ttt.TRANSPOSITION_TABLE.clear()
+
+    def solve(board):
+        action, value = next(ttt.solve_many([board]))
+        return action, value, None
+    return solve
+
+
+@register("solution-table")
+def _solution_table():
+    handle, path = tempfile.mkstemp(suffix=".bin")
+    os.close(handle)
+    try:
+        solutions.build_table(path)
+        table = solutions.SolutionTable(path)
+    finally:
+        os.remove(path)
+
+    def solve(board):
+        value, action, distance = table.lookup(ttt.game_state(board))
+        return action, value, distance
+    return solve
+
+
+class Mismatch:
+    """An answer of an engine that differs from the reference"""
+    __slots__ = ("engine", "state", "field", "expected", "found")
+
+    def __init__(self, engine, state, field, expected, found):
+        self.engine = engine
+        self.state = state
+        self.field = field
+        self.expected = expected
+        self.found = found
+
+    def __repr__(self):
+        return (f"Mismatch({self.engine}: {self.field} expected {self.expected!r}, "
+                f"found {self.found!r} on {self.state!r})")
+
+
+def positions(reference):
+    """Boards of every unfinished position in the reference, fewest pieces first"""
+    boards = []
+    for x, o in sorted(reference, key=lambda key: ((key[0] | key[1]).bit_count(), key)):
+        state = ttt.GameState(x, o)
+        if not state.terminal():
+            board = state.to_board()
+            # Build the cached state now rather than in an engine's time
+            board.state()
+            boards.append(board)
+    return boards
+
+
+def check(name, solve, boards, reference):
+    """Runs one engine over the boards; returns (seconds, mismatches)"""
+    answers = []
+    started = time.perf_counter()
+    for board in boards:
+        answers.append(solve(board))
+    seconds = time.perf_counter() - started
+
+    mismatches = []
+    for board, (action, value, distance) in zip(boards, answers):
+        state = ttt.game_state(board)
+        expected_value, _, expected_distance = reference[(state.x, state.o)]
+        if value is not None and value != expected_value:
+            mismatches.append(Mismatch(name, state, "value", expected_value, value))
+        if distance is not None and distance != expected_distance:
+            mismatches.append(Mismatch(name, state, "distance", expected_distance, distance))
+        if action not in state.actions():
+            mismatches.append(Mismatch(name, state, "move", "a legal move", action))
+            continue
+        child = state.copy()
+        child.push(action[0] * ttt.SIZE + action[1])
+        child_value, _, child_distance = reference[(child.x, child.o)]
+        if (child_value, child_distance + 1) != (expected_value, expected_distance):
+            mismatches.append(Mismatch(name, state, "move", (expected_value, expected_distance),
+                                       (child_value, child_distance + 1)))
+    return seconds, mismatches
+
+
+def run(engines=None, reference=None):
+    """
+    Checks engines (names in ENGINES, or a dict of name to factory; all
+    registered engines by default) on every unfinished 3x3 position.
+    Returns {name: {"positions", "seconds", "per_second", "mismatches"}}.
+    """
+    if engines is None:
+        engines = ENGINES
+    elif not isinstance(engines, dict):
+        engines = {name: ENGINES[name] for name in engines}
+    if reference is None:
+        reference = solutions.solve()
+    boards = positions(reference)
+    results = {}
+    for name, factory in engines.items():
+        seconds, mismatches = check(name, factory(), boards, reference)
+        results[name] = {
+            "positions": len(boards),
+            "seconds": seconds,
+            "per_second": len(boards) / seconds if seconds else float("inf"),
+            "mismatches": mismatches,
+        }
+    return results
+
+
+def report(results, shown=5):
+    lines = [f"{'engine':<20} {'positions/s':>12} {'seconds':>9} {'mismatches':>11}"]
+    for name, result in results.items():
+        lines.append(f"{name:<20} {result['per_second']:>12.0f} {result['seconds']:>9.3f} "
+                     f"{len(result['mismatches']):>11}")
+    for result in results.values():
+        lines.extend(f"  {mismatch!r}" for mismatch in result["mismatches"][:shown])
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check the engines against the solved game on every reachable 3x3 position.")
+    parser.add_argument("engines", nargs="*", metavar="engine",
+                        help=f"default: all of {', '.join(ENGINES)}")
+    options = parser.parse_args()
+    unknown = set(options.engines) - set(ENGINES)
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(sorted(unknown))}")
+    results = run(options.engines or None)
+    print(report(results))
+    if any(result["mismatches"] for result in results.values()):
+        sys.exit(1)
@@ -0,0 +1,229 @@
+"""
+Monte Carlo tree search (UCT), for boards too big for the exact search.
+
+Selected with minimax(board, engine="mcts", iterations=..., time_limit=...).
+Each iteration walks down the tree by the UCT rule, expands one new child
+and finishes the game with a random playout on the bitboard state.
+
+The tree of the last search on each geometry is kept, unless the caller
+passes a tree of its own, and a later search from a position reached by
+playing on from its root starts from the subtree of that position. With processes > 1 the root is searched by
+independent trees in a process pool and their visit counts are added
+up (root parallelism); those trees are not kept.
+"""
+
+import math
+import random
+import time
+
+import pools
+import tictactoe as ttt
+
+# Exploration constant of the UCT rule
+EXPLORATION = math.sqrt(2)
+DEFAULT_ITERATIONS = 10_000
+
+
+class MCTSNode:
+    """
+    One position in the tree. reward adds up the playout results (1 win,
+    0.5 draw, 0 loss) for the player who moved into the position.
+    """
+    __slots__ = ("cell", "parent", "children", "untried", "visits", "reward")
+
+    def __init__(self, cell, parent, untried):
+        self.cell = cell
+        self.parent = parent
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.reward = 0.0
+
+    def select(self, log_visits):
+        """Returns the child with the highest upper confidence bound"""
+        best = None
+        best_bound = -1.0
+        for child in self.children:
+            bound = (child.reward / child.visits
+                     + EXPLORATION * math.sqrt(log_visits / child.visits))
+            if bound > best_bound:
+                best = child
+                best_bound = bound
+        return best
+
+    def depth(self):
+        """Length of the longest line below this node"""
+        return 1 + max((child.depth() for child in self.children), default=-1)
+
+
+def _empty_cells(state, rng):
+    """Empty cells of a state in random order"""
+    free = state.empties()
+    cells = []
+    while free:
+        bit = free & -free
+        cells.append(bit.bit_length() - 1)
+        free ^= bit
+    rng.shuffle(cells)
+    return cells
+
+
+class MCTS:
+    """A search tree over one geometry, kept between searches"""
+
+    def __init__(self, geometry, seed=None):
+        self.geometry = geometry
+        self.rng = random.Random(seed)
+        self.root = None
+        self.root_state = None
+
+    def reroot(self, state):
+        """Moves the root to state, keeping its subtree when the tree already has it"""
+        node = self.root
+        if node is not None:
+            old = self.root_state
+            walk = ttt.GameState(old.x, old.o, old.turn, self.geometry)
+            while node is not None and (walk.x, walk.o) != (state.x, state.o):
+                new = (state.x & ~walk.x) if walk.turn == ttt.X else (state.o & ~walk.o)
+                if (walk.x & ~state.x) or (walk.o & ~state.o):
+                    node = None
+                    break
+                node = next((child for child in node.children if new >> child.cell & 1), None)
+                if node is not None:
+                    walk.push(node.cell)
+        if node is None:
+            node = MCTSNode(-1, None, _empty_cells(state, self.rng))
+        node.parent = None
+        self.root = node
+        self.root_state = ttt.GameState(state.x, state.o, state.turn, self.geometry)
+        return node
+
+    def search(self, state, iterations=None, deadline=None, stop=None):
+        """Runs iterations (or until the deadline) from state; returns the iterations run"""
+        root = self.reroot(state)
+        rng = self.rng
+        base = self.root_state
+        walk = ttt.GameState(base.x, base.o, base.turn, self.geometry)
+        cells = self.geometry.cells
+        movers = (ttt.O if base.turn == ttt.X else ttt.X, base.turn)
+        if iterations is None:
+            iterations = math.inf if deadline is not None else DEFAULT_ITERATIONS
+        done = 0
+
+        while done < iterations:
+            if done and not done & 63 and (
+                    (deadline is not None and time.perf_counter() >= deadline)
+                    or (stop is not None and stop.is_set())):
+                break
+            done += 1
+            walk.x, walk.o, walk.turn = base.x, base.o, base.turn
+            walk.count, walk.won = base.count, base.won
+
+            # Selection
+            node = root
+            path = [root]
+            while not node.untried and node.children:
+                node = node.select(math.log(node.visits))
+                walk.push(node.cell)
+                path.append(node)
+
+            # Expansion
+            if node.untried:
+                cell = node.untried.pop()
+                walk.push(cell)
+                node = MCTSNode(cell, node, [] if walk.won is not None else _empty_cells(walk, rng))
+                path[-1].children.append(node)
+                path.append(node)
+
+            # Playout, on the cells left in random order
+            if walk.won is None and walk.count < cells:
+                for cell in _empty_cells(walk, rng):
+                    walk.push(cell)
+                    if walk.won is not None:
+                        break
+
+            # Backpropagation: the root's side to move made the odd plies
+            winner = walk.won
+            for ply, node in enumerate(path):
+                node.visits += 1
+                if winner is None:
+                    node.reward += 0.5
+                elif winner == movers[ply & 1]:
+                    node.reward += 1.0
+        return done
+
+    def best(self):
+        """Returns the most visited child of the root"""
+        return max(self.root.children, key=lambda child: child.visits, default=None)
+
+
+_trees = {}
+
+
+def tree_for(geometry):
+    """The kept tree of a geometry"""
+    tree = _trees.get(geometry)
+    if tree is None:
+        tree = _trees[geometry] = MCTS(geometry)
+    return tree
+
+
+def _root_search(task):
+    """Searches one independent tree in a worker; returns per-cell (visits, reward)"""
+    x, o, size, k, iterations, time_limit, seed = task
+    geometry = ttt.get_geometry(size, k)
+    state = ttt.GameState(x, o, geometry=geometry)
+    tree = MCTS(geometry, seed)
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    done = tree.search(state, iterations, deadline)
+    return done, [(child.cell, child.visits, child.reward) for child in tree.root.children]
+
+
+def choose(state, iterations=None, time_limit=None, processes=None, info=None, stop=None,
+           seed=None, tree=None):
+    """
+    Returns the cell MCTS picks for a non-terminal state, searching tree
+    (an MCTS of the state's geometry) or else the geometry's kept tree.
+    """
+    geometry = state.geometry
+    if tree is not None and tree.geometry is not geometry:
+        raise ValueError("The tree is for another geometry")
+    if processes is not None and processes > 1:
+        share = None if iterations is None else -(-iterations // processes)
+        if share is None and time_limit is None:
+            share = -(-DEFAULT_ITERATIONS // processes)
+        base = random.Random(seed).getrandbits(32)
+        tasks = [(state.x, state.o, geometry.size, geometry.k, share, time_limit, base + i)
+                 for i in range(processes)]
+        totals = {}
+        done = 0
+        pool = pools.worker_pool(__name__, processes)
+        for worker_done, children in pool.map(_root_search, tasks):
+            done += worker_done
+            for cell, visits, reward in children:
+                total = totals.setdefault(cell, [0, 0.0])
+                total[0] += visits
+                total[1] += reward
+        cell, (visits, reward) = max(totals.items(), key=lambda item: item[1][0])
+        depth = 1
+    else:
+        if tree is None:
+            tree = tree_for(geometry)
+        if seed is not None:
+            tree.rng.seed(seed)
+        deadline = None if time_limit is None else time.perf_counter() + time_limit
+        done = tree.search(state, iterations, deadline, stop)
+        best = tree.best()
+        cell, visits, reward = best.cell, best.visits, best.reward
+        depth = tree.root.depth()
+
+    if info is not None:
+        # Mean playout result of the move, as a score from X's side
+        expected = 2 * reward / visits - 1
+        info.score = expected if state.turn == ttt.X else -expected
+        info.value = None
+        info.nodes = done
+        info.depth = depth
+        info.completed = False
+        info.move = divmod(cell, geometry.size)
+    return cell
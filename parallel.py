@@ -0,0 +1,153 @@
+"""
+Root-split alpha-beta across a process pool, for minimax(..., processes=N).
+
+Young Brothers Wait at the root: the first action is searched here, with
+a full window, and the rest are handed to the pool once its score is
+known. The best root score found so far lives in shared memory and each
+root move is searched against it, so moves picked up later by a worker
+prune against everything finished before them.
+
+A move that only ties the best so far fails low, as in the serial
+search. Where that best came from a later action the earlier one is
+searched again to tell a tie from a worse score, so the merge keeps the
+serial rule: the first action in actions() order with the best score wins.
+
+Every worker searches against the caller's deadline, and once one root
+move runs out of time the moves still queued are not started.
+"""
+
+import math
+import multiprocessing
+import time
+
+import pools
+import tictactoe as ttt
+
+# The best root score so far, seen by every worker, from the root mover's side
+_shared = None
+# Set once any root move runs out of budget, so queued moves are not started
+_abort = None
+
+
+def _init(shared, abort):
+    global _shared, _abort
+    _shared = shared
+    _abort = abort
+
+
+# The shared best score and abort event handed to each pool's workers
+_values = {}
+
+
+def _pool(processes):
+    """Returns the kept (pool, shared best score, abort event) for a number of processes"""
+    values = _values.get(processes)
+    if values is None:
+        values = _values[processes] = (multiprocessing.Value("d", -math.inf),
+                                       multiprocessing.Event())
+    return (pools.worker_pool(__name__, processes, _init, values), *values)
+
+
+def _search_move(state, cell, search, bound, ties=False):
+    """
+    Returns (score, exact) of the root move on cell. The score is exact
+    when it is better for the root mover than bound, or as good with ties.
+    """
+    if ties:
+        bound = math.nextafter(bound, -math.inf)
+    if state.turn == ttt.X:
+        alpha, beta = bound, math.inf
+        reply = ttt.min_player
+    else:
+        alpha, beta = -math.inf, -bound
+        reply = ttt.max_player
+    state.push(cell)
+    score = reply(state, None, alpha, beta, search)
+    state.pop(cell)
+    return score, alpha < score < beta
+
+
+def _search_task(task):
+    """
+    Searches one root move in a worker against the shared bound. Returns
+    the cell, the score (None if the time ran out, here or for another
+    move), whether it is exact, the bound it was searched against and the
+    nodes searched.
+    """
+    x, o, size, k, cell, depth_limit, deadline, ordering = task
+    if _abort.is_set():
+        return cell, None, False, _shared.value, 0
+    state = ttt.GameState(x, o, geometry=ttt.get_geometry(size, k))
+    if deadline is not None:
+        # The deadline is on the monotonic clock every process shares
+        deadline = time.perf_counter() + deadline - time.monotonic()
+    search = ttt.Search(state, deadline=deadline, ordering=ordering, stop=_abort)
+    search.depth_limit = depth_limit
+    sign = 1 if state.turn == ttt.X else -1
+    bound = _shared.value
+    try:
+        score, exact = _search_move(state, cell, search, bound)
+    except ttt.SearchBudgetExhausted:
+        _abort.set()
+        return cell, None, False, bound, search.nodes
+    if exact:
+        with _shared.get_lock():
+            if sign * score > _shared.value:
+                _shared.value = sign * score
+    return cell, score, exact, bound, search.nodes
+
+
+def iteration(state, search, processes):
+    """
+    Searches the root of state to search.depth_limit, the root moves split
+    over processes, and returns its score. Sets search.best_cell and adds
+    the workers' nodes to search.nodes; raises SearchBudgetExhausted when
+    the deadline passes first.
+    """
+    pool, shared, abort = _pool(processes)
+    geometry = state.geometry
+    sign = 1 if state.turn == ttt.X else -1
+    moves = [i * geometry.size + j for i, j in state.actions()]
+
+    # The eldest brother sets the bound the others are searched against
+    first = moves[0]
+    score, _exact = _search_move(state, first, search, -math.inf)
+    search.best_cell = first
+    shared.value = sign * score
+    scores = {first: score}
+    bounds = {}
+
+    deadline = None
+    if search.deadline != math.inf:
+        deadline = time.monotonic() + search.deadline - time.perf_counter()
+    tasks = [(state.x, state.o, geometry.size, geometry.k, cell, search.depth_limit, deadline,
+              search.ordering) for cell in moves[1:]]
+    abort.clear()
+    exhausted = False
+    for cell, score, exact, bound, nodes in pool.imap_unordered(_search_task, tasks):
+        search.nodes += nodes
+        if score is None:
+            exhausted = True
+        elif exact:
+            scores[cell] = score
+        else:
+            bounds[cell] = bound
+    if exhausted:
+        raise ttt.SearchBudgetExhausted()
+
+    best_score = None
+    for cell in moves:
+        score = scores.get(cell)
+        if score is not None and (best_score is None or sign * score > sign * best_score):
+            best_score = score
+            search.best_cell = cell
+
+    # A move that failed low against the best score, set by a later move,
+    # may tie it; the earlier one of tied moves is the one to play
+    for cell in moves[:moves.index(search.best_cell)]:
+        if bounds.get(cell) == sign * best_score:
+            score, exact = _search_move(state, cell, search, sign * best_score, ties=True)
+            if exact:
+                search.best_cell = cell
+                break
+    return best_score
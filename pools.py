@@ -0,0 +1,35 @@
+"""
+Process pools kept for the life of the interpreter.
+
+Starting a pool costs far more than a move's search, so the parallel
+engines (parallel.py, mcts.py) keep theirs between searches, one per
+owning module and number of processes. They are all shut down when the
+interpreter exits.
+"""
+
+import atexit
+import multiprocessing
+
+# Pools started so far, by (owner, processes)
+_pools = {}
+
+
+def worker_pool(owner, processes, initializer=None, initargs=()):
+    """
+    Returns the process pool kept for owner (a module name) and a number
+    of processes, starting it on first use.
+    """
+    key = (owner, processes)
+    pool = _pools.get(key)
+    if pool is None:
+        pool = _pools[key] = multiprocessing.Pool(processes, initializer, initargs)
+    return pool
+
+
+@atexit.register
+def shutdown():
+    """Closes every kept pool and waits for its workers to exit"""
+    while _pools:
+        _key, pool = _pools.popitem()
+        pool.close()
+        pool.join()
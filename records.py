@@ -0,0 +1,238 @@
+"""
+Compact game records: the moves of a game as cell indices.
+
+A record file starts with a header naming the geometry, then holds one
+fixed-size record per game: the number of moves, the result (1 X won,
+-1 O won, 0 otherwise) and the cells played, padded to the board size.
+With hashes=True each record also holds a 64-bit hash of the position
+after every move. A 3x3 game takes 11 bytes, 83 with hashes.
+
+RecordWriter and RecordReader stream records one game at a time;
+replay() rebuilds the boards of a game lazily through result(). Fixed
+sizes let scan() map a whole file as a NumPy structured array without
+reading it, so summaries run at memory speed.
+
+Usage: python records.py convert games.jsonl games.ttg   (from tournament.py)
+       python records.py summary games.ttg
+"""
+
+import hashlib
+import json
+import mmap
+import struct
+import sys
+
+import tictactoe as ttt
+
+MAGIC = b"TTTG"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBB")
+HASHES = 1
+NO_CELL = 255
+
+
+def position_hash(state):
+    """64-bit hash of a position: the packed board itself when it fits"""
+    packed = state.packed()
+    if 2 * state.geometry.cells <= 64:
+        return packed
+    data = packed.to_bytes((2 * state.geometry.cells + 7) // 8, "little")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+def record_struct(geometry, hashes=False):
+    """The struct of one record: length, result, cells and optionally hashes"""
+    cells = geometry.cells
+    return struct.Struct(f"<Bb{cells}s" + (f"{cells}Q" if hashes else ""))
+
+
+class GameRecord:
+    """One game: its moves as cell indices, result and optional position hashes"""
+    __slots__ = ("cells", "result", "hashes")
+
+    def __init__(self, cells, result, hashes=None):
+        self.cells = cells
+        self.result = result
+        self.hashes = hashes
+
+    def actions(self, geometry):
+        return [divmod(cell, geometry.size) for cell in self.cells]
+
+    def __eq__(self, other):
+        return (isinstance(other, GameRecord) and self.cells == other.cells
+                and self.result == other.result and self.hashes == other.hashes)
+
+    def __repr__(self):
+        return f"GameRecord(cells={list(self.cells)}, result={self.result})"
+
+
+def encode(actions, geometry=ttt.DEFAULT_GEOMETRY, hashes=False):
+    """Checks a game's actions by playing them and returns its GameRecord"""
+    state = ttt.GameState(geometry=geometry)
+    cells = bytearray()
+    positions = [] if hashes else None
+    for i, j in actions:
+        if state.terminal():
+            raise ValueError("Move after the end of the game")
+        if not (0 <= i < geometry.size and 0 <= j < geometry.size):
+            raise ValueError(f"Move off the board: {(i, j)}")
+        cell = i * geometry.size + j
+        if (state.x | state.o) >> cell & 1:
+            raise ValueError(f"Move on a taken cell: {(i, j)}")
+        state.push(cell)
+        cells.append(cell)
+        if hashes:
+            positions.append(position_hash(state))
+    return GameRecord(bytes(cells), state.utility(),
+                      None if positions is None else tuple(positions))
+
+
+def replay(record, geometry=ttt.DEFAULT_GEOMETRY):
+    """Yields the board after each move of a record, built as it is asked for"""
+    board = ttt.initial_state(geometry.size, geometry.k)
+    for action in record.actions(geometry):
+        board = ttt.result(board, action)
+        yield board
+
+
+class RecordWriter:
+    """Appends game records to a new file"""
+
+    def __init__(self, path, size=3, k=None, hashes=False):
+        self.geometry = ttt.get_geometry(size, k)
+        if self.geometry.cells >= NO_CELL:
+            raise ValueError("Records hold boards of up to 254 cells")
+        self.hashes = hashes
+        self._record = record_struct(self.geometry, hashes)
+        self._handle = open(path, "wb")
+        self._handle.write(HEADER.pack(MAGIC, VERSION, self.geometry.size, self.geometry.k,
+                                       HASHES if hashes else 0))
+        self.count = 0
+
+    def write(self, game):
+        """Writes a game, given as a GameRecord or as its list of (i, j) actions"""
+        if not isinstance(game, GameRecord):
+            game = encode(game, self.geometry, self.hashes)
+        cells = self.geometry.cells
+        fields = [len(game.cells), game.result,
+                  game.cells.ljust(cells, bytes([NO_CELL]))]
+        if self.hashes:
+            if game.hashes is None:
+                game = encode(game.actions(self.geometry), self.geometry, True)
+            fields.extend(game.hashes)
+            fields.extend([0] * (cells - len(game.hashes)))
+        self._handle.write(self._record.pack(*fields))
+        self.count += 1
+
+    def close(self):
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _read_header(handle, path):
+    magic, version, size, k, flags = HEADER.unpack(handle.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a game record file")
+    return ttt.get_geometry(size, k), bool(flags & HASHES)
+
+
+class RecordReader:
+    """Reads the game records of a file one at a time"""
+
+    def __init__(self, path, chunk=4096):
+        self._handle = open(path, "rb")
+        try:
+            self.geometry, self.hashes = _read_header(self._handle, path)
+        except (ValueError, struct.error):
+            self._handle.close()
+            raise
+        self._record = record_struct(self.geometry, self.hashes)
+        self._chunk = chunk
+
+    def __iter__(self):
+        size = self._record.size
+        cells = self.geometry.cells
+        while True:
+            data = self._handle.read(size * self._chunk)
+            if not data:
+                return
+            for fields in self._record.iter_unpack(data[:len(data) - len(data) % size]):
+                length = fields[0]
+                yield GameRecord(fields[2][:length], fields[1],
+                                 tuple(fields[3:3 + length]) if self.hashes else None)
+            if len(data) % size:
+                raise ValueError("Truncated game record")
+
+    def close(self):
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def scan(path):
+    """
+    Maps a record file as a NumPy structured array with fields length,
+    result, cells and (when present) hashes, one row per game. The array
+    reads from the file as it is used; returns (geometry, array).
+    """
+    import numpy as np
+
+    with open(path, "rb") as handle:
+        geometry, hashes = _read_header(handle, path)
+        mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    fields = [("length", "u1"), ("result", "i1"), ("cells", "u1", (geometry.cells,))]
+    if hashes:
+        fields.append(("hashes", "<u8", (geometry.cells,)))
+    dtype = np.dtype(fields)
+    count = (len(mapped) - HEADER.size) // dtype.itemsize
+    return geometry, np.frombuffer(mapped, dtype, count, HEADER.size)
+
+
+def summary(path):
+    """Counts of results, game lengths and first moves over a record file"""
+    import numpy as np
+
+    geometry, games = scan(path)
+    results = np.bincount(games["result"] + 1, minlength=3)
+    first = games["cells"][:, 0]
+    return {
+        "games": len(games),
+        "x_wins": int(results[2]),
+        "o_wins": int(results[0]),
+        "draws": int(results[1]),
+        "lengths": np.bincount(games["length"], minlength=geometry.cells + 1).tolist(),
+        "first_moves": np.bincount(first[first != NO_CELL], minlength=geometry.cells).tolist(),
+    }
+
+
+def convert(source, target, hashes=False):
+    """Writes the games of a tournament.py JSONL file as records; returns the count"""
+    writer = None
+    with open(source) as lines:
+        for line in lines:
+            game = json.loads(line)
+            if writer is None:
+                writer = RecordWriter(target, game.get("size", 3), game.get("k"), hashes)
+            writer.write([tuple(action) for action in game["moves"]])
+    if writer is None:
+        writer = RecordWriter(target, hashes=hashes)
+    writer.close()
+    return writer.count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "convert":
+        print(f"Wrote {convert(sys.argv[2], sys.argv[3])} games to {sys.argv[3]}")
+    elif len(sys.argv) == 3 and sys.argv[1] == "summary":
+        print(json.dumps(summary(sys.argv[2]), indent=2))
+    else:
+        sys.exit(__doc__)
@@ -1,9 +1,34 @@
-import pygame
+import argparse
+import os
 import sys
+import threading
 import time
 
+parser = argparse.ArgumentParser(description="Play Tic-Tac-Toe against the computer.")
+parser.add_argument("board_size", nargs="?", type=int, default=3)
+parser.add_argument("in_a_row", nargs="?", type=int, default=None,
+                    help="marks in a row needed to win")
+parser.add_argument("--fps", type=int, default=30, help="frame rate cap")
+parser.add_argument("--headless", action="store_true",
+                    help="render off screen with SDL's dummy driver; the computer plays both sides")
+parser.add_argument("--frames", type=int, default=None,
+                    help="quit after this many frames and report the rendering cost")
+options = parser.parse_args()
+
+if options.headless:
+    # Must be set before pygame opens a display
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+import pygame
+
+import book
+import solutions
 import tictactoe as ttt
 
+board_size = options.board_size
+in_a_row = options.in_a_row
+
 pygame.init()
 size = width, height = 600, 400
 
@@ -15,48 +40,139 @@ screen = pygame.display.set_mode(size)
 
 mediumFont = pygame.font.Font("OpenSans-Regular.ttf", 28)
 largeFont = pygame.font.Font("OpenSans-Regular.ttf", 40)
-moveFont = pygame.font.Font("OpenSans-Regular.ttf", 60)
+tile_size = 240 // board_size
+time_limit = ttt.default_time_limit(board_size)
+moveFont = pygame.font.Font("OpenSans-Regular.ttf", tile_size * 3 // 4)
+
+# Answer from the precomputed table when it has been built (python solutions.py),
+# else from an opening book (python book.py build) and a cache of solved positions
+if board_size == 3 and in_a_row in (None, 3) and os.path.exists(solutions.DEFAULT_PATH):
+    table = solutions.SolutionTable(solutions.DEFAULT_PATH)
+else:
+    book_path = book.default_path(board_size, in_a_row)
+    table = book.PositionCache(
+        book.OpeningBook.load(book_path) if os.path.exists(book_path) else None)
+
+# Shortest time a computer move stays on "thinking", so instant answers are visible
+ai_delay = 0 if options.headless else 0.5
+clock = pygame.time.Clock()
+
+# Layout, fixed for the whole session
+playXButton = pygame.Rect((width / 8), (height / 2), width / 4, 50)
+playOButton = pygame.Rect(5 * (width / 8), (height / 2), width / 4, 50)
+bottomButton = pygame.Rect(width / 3, height - 65, width / 3, 50)
+tile_origin = (width / 2 - (board_size / 2 * tile_size),
+               height / 2 - (board_size / 2 * tile_size))
+tiles = [
+    [
+        pygame.Rect(
+            tile_origin[0] + j * tile_size,
+            tile_origin[1] + i * tile_size,
+            tile_size, tile_size
+        )
+        for j in range(board_size)
+    ]
+    for i in range(board_size)
+]
+
+glyphs = {}
+
+
+def render_text(font, text, color=white):
+    """Returns the rendered surface for text, rendering each string only once"""
+    key = (font, text, color)
+    glyph = glyphs.get(key)
+    if glyph is None:
+        if len(glyphs) > 256:
+            # Progress titles are all different; don't keep them forever
+            glyphs.clear()
+        glyph = glyphs[key] = font.render(text, True, color)
+    return glyph
+
+
+def blit_centered(glyph, center):
+    rect = glyph.get_rect()
+    rect.center = center
+    screen.blit(glyph, rect)
+
+
+def draw_button(rect, text):
+    pygame.draw.rect(screen, white, rect)
+    blit_centered(render_text(mediumFont, text, black), rect.center)
+
+
+def draw(user, board, title, font, button):
+    """Redraws the whole frame"""
+    screen.fill(black)
 
-user = None
-board = ttt.initial_state()
-ai_turn = False
+    if user is None:
+        blit_centered(render_text(largeFont, "Play Tic-Tac-Toe"), ((width / 2), 50))
+        draw_button(playXButton, "Play as X")
+        draw_button(playOButton, "Play as O")
+        return
+
+    for i, row in enumerate(tiles):
+        for j, rect in enumerate(row):
+            pygame.draw.rect(screen, white, rect, 3)
+            if board[i][j] != ttt.EMPTY:
+                blit_centered(render_text(moveFont, board[i][j]), rect.center)
+    blit_centered(render_text(font, title), ((width / 2), 30))
+    if button is not None:
+        draw_button(bottomButton, button)
+
+
+class AIMove:
+    """Searches for the computer's move on a worker thread, so the window stays live"""
+
+    def __init__(self, board):
+        self.info = ttt.SearchInfo()
+        self.stop = threading.Event()
+        self.started = time.monotonic()
+        self.move = None
+        self.thread = threading.Thread(target=self.run, args=(board,), daemon=True)
+        self.thread.start()
+
+    def run(self, board):
+        self.move = ttt.minimax(board, table=table, time_limit=time_limit,
+                                info=self.info, stop=self.stop)
+
+    def cancel(self):
+        """Ends the search early; it then answers with the best move found so far"""
+        self.stop.set()
+
+    def ready(self):
+        if self.thread.is_alive():
+            return False
+        return self.stop.is_set() or time.monotonic() - self.started >= ai_delay
+
+
+user = ttt.X if options.headless else None
+board = ttt.initial_state(board_size, in_a_row)
+ai_move = None
+last_view = None
+frames = draws = 0
+draw_time = 0.0
 
 while True:
 
-    for event in pygame.event.get():
+    events = pygame.event.get()
+    for event in events:
         if event.type == pygame.QUIT:
+            if ai_move is not None:
+                ai_move.cancel()
             sys.exit()
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE and ai_move is not None:
+            ai_move.cancel()
 
-    screen.fill(black)
+    click, _, _ = pygame.mouse.get_pressed()
+    mouse = pygame.mouse.get_pos()
+    title = font = button = None
 
     # Let user choose a player.
     if user is None:
 
-        # Draw title
-        title = largeFont.render("Play Tic-Tac-Toe", True, white)
-        titleRect = title.get_rect()
-        titleRect.center = ((width / 2), 50)
-        screen.blit(title, titleRect)
-
-        # Draw buttons
-        playXButton = pygame.Rect((width / 8), (height / 2), width / 4, 50)
-        playX = mediumFont.render("Play as X", True, black)
-        playXRect = playX.get_rect()
-        playXRect.center = playXButton.center
-        pygame.draw.rect(screen, white, playXButton)
-        screen.blit(playX, playXRect)
-
-        playOButton = pygame.Rect(5 * (width / 8), (height / 2), width / 4, 50)
-        playO = mediumFont.render("Play as O", True, black)
-        playORect = playO.get_rect()
-        playORect.center = playOButton.center
-        pygame.draw.rect(screen, white, playOButton)
-        screen.blit(playO, playORect)
-
         # Check if button is clicked
-        click, _, _ = pygame.mouse.get_pressed()
         if click == 1:
-            mouse = pygame.mouse.get_pos()
             if playXButton.collidepoint(mouse):
                 time.sleep(0.2)
                 user = ttt.X
@@ -66,81 +182,73 @@ while True:
 
     else:
 
-        # Draw game board
-        tile_size = 80
-        tile_origin = (width / 2 - (1.5 * tile_size),
-                       height / 2 - (1.5 * tile_size))
-        tiles = []
-        for i in range(3):
-            row = []
-            for j in range(3):
-                rect = pygame.Rect(
-                    tile_origin[0] + j * tile_size,
-                    tile_origin[1] + i * tile_size,
-                    tile_size, tile_size
-                )
-                pygame.draw.rect(screen, white, rect, 3)
-
-                if board[i][j] != ttt.EMPTY:
-                    move = moveFont.render(board[i][j], True, white)
-                    moveRect = move.get_rect()
-                    moveRect.center = rect.center
-                    screen.blit(move, moveRect)
-                row.append(rect)
-            tiles.append(row)
-
         game_over = ttt.terminal(board)
         player = ttt.player(board)
+        computer_to_move = not game_over and (options.headless or user != player)
+
+        # Check for AI move, searched in the background and polled each frame
+        if computer_to_move:
+            if ai_move is None:
+                ai_move = AIMove(board)
+            elif ai_move.ready():
+                board = ttt.result(board, ai_move.move)
+                ai_move = None
+                game_over = ttt.terminal(board)
+                player = ttt.player(board)
+
+        # Check for a user move
+        if click == 1 and user == player and not game_over and ai_move is None:
+            for i in range(board_size):
+                for j in range(board_size):
+                    if (board[i][j] == ttt.EMPTY and tiles[i][j].collidepoint(mouse)):
+                        board = ttt.result(board, (i, j))
+
+        # Let the player cut a long search short
+        if ai_move is not None:
+            button = "Move Now"
+            if click == 1 and bottomButton.collidepoint(mouse):
+                ai_move.cancel()
 
-        # Show title
         if game_over:
+            button = "Play Again"
+            if options.headless or (click == 1 and bottomButton.collidepoint(mouse)):
+                if not options.headless:
+                    time.sleep(0.2)
+                    user = None
+                board = ttt.initial_state(board_size, in_a_row)
+
+        # Show title
+        font = largeFont
+        if ttt.terminal(board):
             winner = ttt.winner(board)
             if winner is None:
                 title = f"Game Over: Tie."
             else:
                 title = f"Game Over: {winner} wins."
-        elif user == player:
+        elif ai_move is None and not options.headless and user == ttt.player(board):
             title = f"Play as {user}"
+        elif ai_move is not None and ai_move.info.nodes:
+            title = (f"Computer thinking... depth {ai_move.info.depth}, "
+                     f"{ai_move.info.nodes:,} nodes")
+            font = mediumFont
         else:
             title = f"Computer thinking..."
-        title = largeFont.render(title, True, white)
-        titleRect = title.get_rect()
-        titleRect.center = ((width / 2), 30)
-        screen.blit(title, titleRect)
-
-        # Check for AI move
-        if user != player and not game_over:
-            if ai_turn:
-                time.sleep(0.5)
-                move = ttt.minimax(board)
-                board = ttt.result(board, move)
-                ai_turn = False
-            else:
-                ai_turn = True
-
-        # Check for a user move
-        click, _, _ = pygame.mouse.get_pressed()
-        if click == 1 and user == player and not game_over:
-            mouse = pygame.mouse.get_pos()
-            for i in range(3):
-                for j in range(3):
-                    if (board[i][j] == ttt.EMPTY and tiles[i][j].collidepoint(mouse)):
-                        board = ttt.result(board, (i, j))
-
-        if game_over:
-            againButton = pygame.Rect(width / 3, height - 65, width / 3, 50)
-            again = mediumFont.render("Play Again", True, black)
-            againRect = again.get_rect()
-            againRect.center = againButton.center
-            pygame.draw.rect(screen, white, againButton)
-            screen.blit(again, againRect)
-            click, _, _ = pygame.mouse.get_pressed()
-            if click == 1:
-                mouse = pygame.mouse.get_pos()
-                if againButton.collidepoint(mouse):
-                    time.sleep(0.2)
-                    user = None
-                    board = ttt.initial_state()
-                    ai_turn = False
 
-    pygame.display.flip()
+    # Only redraw when something on screen changed or input arrived
+    view = (user, tuple(map(tuple, board)), title, button)
+    if events or view != last_view:
+        started = time.perf_counter()
+        draw(user, board, title, font, button)
+        pygame.display.flip()
+        draw_time += time.perf_counter() - started
+        draws += 1
+        last_view = view
+
+    frames += 1
+    if options.frames is not None and frames >= options.frames:
+        print(f"{frames} frames, {draws} redrawn, "
+              f"{draw_time / max(draws, 1) * 1000:.3f} ms per redraw")
+        if ai_move is not None:
+            ai_move.cancel()
+        break
+    clock.tick(options.fps)
@@ -0,0 +1,346 @@
+"""
+Asyncio move server: newline-delimited JSON over TCP.
+
+Each request line is an object with the board as rows of "X", "O" and
+null, and optionally k (marks in a row) and an id that is echoed back:
+
+    {"id": 1, "board": [["X", null, null], [null, "O", null], [null, null, null]]}
+    {"id": 1, "move": [0, 1], "value": 0, "cached": false}
+
+The value is null when the board is too big to solve and the move comes
+from a search that ran out of time; such answers are not cached.
+
+Errors are answered as {"id": ..., "error": "..."}, boards larger than
+max_size (9x9 by default) among them. {"stats": true} returns the cache
+counters.
+
+Solved positions are kept in a shared LRU cache. Misses are searched in a
+process pool, and concurrent requests for the same position share one
+search, so the event loop never blocks. A connection's requests are
+answered in order, one at a time. Past max_pending searches in flight new
+misses are refused with "busy", and a search slower than the timeout is
+answered with "timeout" (it still finishes and fills the cache).
+
+    python server.py serve --port 8765
+    python server.py load --clients 50 --requests 5000
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import random
+import time
+
+import solutions
+import tictactoe as ttt
+
+DEFAULT_PORT = 8765
+# Largest board accepted; building the geometry of a bigger one would stall the event loop
+MAX_SIZE = 9
+
+
+def parse_board(request, max_size=MAX_SIZE):
+    """Returns the Board in a request, or raises ValueError"""
+    rows = request.get("board")
+    if not isinstance(rows, list) or not rows:
+        raise ValueError("board must be a list of rows")
+    size = len(rows)
+    if size > max_size:
+        raise ValueError(f"board must be at most {max_size}x{max_size}")
+    if any(not isinstance(row, list) or len(row) != size for row in rows):
+        raise ValueError("board must be square")
+    if any(cell not in (ttt.X, ttt.O, ttt.EMPTY) for row in rows for cell in row):
+        raise ValueError('cells must be "X", "O" or null')
+    k = request.get("k")
+    if k is not None and (not isinstance(k, int) or not 1 <= k <= size):
+        raise ValueError("k must be between 1 and the board size")
+    board = ttt.Board(rows, ttt.get_geometry(size, k))
+    state = ttt.GameState.from_board(board)
+    if not 0 <= state.x.bit_count() - state.o.bit_count() <= 1:
+        raise ValueError("X and O have not taken turns")
+    return board
+
+
+def solve(rows, size, k):
+    """Searches one position; runs in a worker process"""
+    board = ttt.Board(rows, ttt.get_geometry(size, k))
+    info = ttt.SearchInfo()
+    move = ttt.minimax(board, table=solutions.process_table,
+                       time_limit=ttt.default_time_limit(size), info=info)
+    return move, info.value if info.completed else None
+
+
+class LRUCache:
+    """Maps keys to values, dropping the least recently used past maxsize"""
+
+    def __init__(self, maxsize=100_000):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class MoveServer:
+    """Answers move requests; pass an executor to search somewhere other than a process pool"""
+
+    def __init__(self, executor=None, cache_size=100_000, max_pending=64, timeout=5.0,
+                 table=None, max_size=MAX_SIZE):
+        if executor is None:
+            # Forked workers would inherit open client sockets and keep them
+            # from closing; start them from a clean process instead
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            executor = concurrent.futures.ProcessPoolExecutor(
+                mp_context=multiprocessing.get_context(method),
+                initializer=solutions.open_process_table, initargs=(table,))
+        self.executor = executor
+        self.cache = LRUCache(cache_size)
+        self.pending = {}
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.max_size = max_size
+        self.refused = 0
+        self.timeouts = 0
+        self.connections = set()
+
+    async def move(self, board):
+        """Returns (move, value, cached) for a board"""
+        geometry = board.geometry
+        state = ttt.GameState.from_board(board)
+        if state.terminal():
+            return None, state.utility(), False
+        key = (geometry.size, geometry.k, state.packed())
+
+        solved = self.cache.get(key)
+        if solved is not None:
+            return solved + (True,)
+
+        future = self.pending.get(key)
+        if future is None:
+            if len(self.pending) >= self.max_pending:
+                self.refused += 1
+                raise OverflowError("busy")
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self.executor, solve, [list(row) for row in board], geometry.size, geometry.k)
+            self.pending[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+
+        try:
+            solved = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        return solved + (False,)
+
+    def _finish(self, key, future):
+        del self.pending[key]
+        # Only solved positions are kept; a move found under a time limit is not exact
+        if (not future.cancelled() and future.exception() is None
+                and future.result()[1] is not None):
+            self.cache.put(key, future.result())
+
+    async def answer(self, request):
+        """Returns the reply to one decoded request"""
+        reply = {"id": request.get("id")}
+        if request.get("stats"):
+            reply.update(cached=len(self.cache), hits=self.cache.hits,
+                         misses=self.cache.misses, pending=len(self.pending),
+                         refused=self.refused, timeouts=self.timeouts)
+            return reply
+        try:
+            board = parse_board(request, self.max_size)
+            move, value, cached = await self.move(board)
+        except ValueError as error:
+            reply["error"] = str(error)
+        except OverflowError:
+            reply["error"] = "busy"
+        except asyncio.TimeoutError:
+            reply["error"] = "timeout"
+        except Exception as error:
+            reply["error"] = f"search failed: {error!r}"
+        else:
+            reply.update(move=None if move is None else list(move), value=value, cached=cached)
+        return reply
+
+    async def handle(self, reader, writer):
+        connection = asyncio.current_task()
+        self.connections.add(connection)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than the stream limit; the connection is unusable
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError
+                except ValueError:
+                    reply = {"id": None, "error": "request must be a JSON object"}
+                else:
+                    reply = await self.answer(request)
+                writer.write(json.dumps(reply).encode() + b"\n")
+                # Don't read more from a client that isn't reading its replies
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(connection)
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        return await asyncio.start_server(self.handle, host, port, limit=64 * 1024)
+
+    async def wait_disconnected(self, timeout=1.0):
+        """Gives clients that have hung up the time to finish their connections"""
+        if self.connections:
+            await asyncio.wait(self.connections, timeout=timeout)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def random_boards(count, size=3, k=None, seed=0):
+    """Positions from random play, a mix of openings and middle games"""
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        board = ttt.initial_state(size, k)
+        for _ply in range(rng.randrange(size * size)):
+            if ttt.terminal(board):
+                break
+            board = ttt.result(board, rng.choice(sorted(ttt.actions(board))))
+        if not ttt.terminal(board):
+            boards.append(board)
+    return boards
+
+
+async def load(host, port, boards, clients=10, requests=1000):
+    """
+    Sends requests from concurrent clients, each waiting for its reply
+    before the next request. Returns (latencies in seconds, errors, seconds).
+    """
+    latencies = []
+    errors = collections.Counter()
+    share, extra = divmod(requests, clients)
+
+    async def client(number, count):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for i in range(count):
+                board = boards[(number + i * clients) % len(boards)]
+                request = {"id": i, "board": board, "k": board.geometry.k}
+                started = time.perf_counter()
+                writer.write(json.dumps(request).encode() + b"\n")
+                reply = json.loads(await reader.readline())
+                latencies.append(time.perf_counter() - started)
+                if "error" in reply:
+                    errors[reply["error"]] += 1
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(number, share + (number < extra))
+                           for number in range(clients)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def _main(options):
+    table = None
+    if os.path.exists(solutions.DEFAULT_PATH):
+        table = solutions.DEFAULT_PATH
+
+    if options.command == "serve":
+        server = MoveServer(cache_size=options.cache, max_pending=options.max_pending,
+                            timeout=options.timeout, table=table,
+                            max_size=options.max_size)
+        listener = await server.start(options.host, options.port)
+        print(f"Serving moves on {options.host}:{options.port}")
+        try:
+            await listener.serve_forever()
+        finally:
+            server.close()
+        return
+
+    boards = random_boards(options.positions, options.size, options.k, options.seed)
+    server = listener = None
+    host, port = options.host, options.port
+    if port is None:
+        # No server given: load one in this process
+        server = MoveServer(cache_size=options.cache, max_pending=options.max_pending,
+                            timeout=options.timeout, table=table,
+                            max_size=options.max_size)
+        listener = await server.start(host, 0)
+        port = listener.sockets[0].getsockname()[1]
+    try:
+        latencies, errors, elapsed = await load(host, port, boards, options.clients,
+                                                options.requests)
+    finally:
+        if listener is not None:
+            listener.close()
+            await server.wait_disconnected()
+            server.close()
+    latencies.sort()
+    print(f"{len(latencies)} requests in {elapsed:.2f}s, {len(latencies) / elapsed:.0f}/s")
+    print("latency ms: " + ", ".join(
+        f"p{fraction * 100:g} {percentile(latencies, fraction) * 1000:.2f}"
+        for fraction in (0.5, 0.9, 0.99, 0.999)))
+    if errors:
+        print("errors: " + ", ".join(f"{error} {count}" for error, count in errors.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve tic-tac-toe moves over TCP.")
+    parser.add_argument("command", choices=("serve", "load"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None,
+                        help=f"serve: default {DEFAULT_PORT}; load: default starts a local server")
+    parser.add_argument("--cache", type=int, default=100_000, help="positions kept in the cache")
+    parser.add_argument("--max-pending", type=int, default=64,
+                        help="searches in flight before new ones are refused")
+    parser.add_argument("--timeout", type=float, default=5.0, help="seconds per request")
+    parser.add_argument("--max-size", type=int, default=MAX_SIZE,
+                        help="largest board size accepted")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--positions", type=int, default=500, help="distinct boards to request")
+    parser.add_argument("--size", type=int, default=3)
+    parser.add_argument("--k", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+    if options.command == "serve" and options.port is None:
+        options.port = DEFAULT_PORT
+    try:
+        asyncio.run(_main(options))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,139 @@
+"""
+Precomputed solution of every reachable Tic Tac Toe position.
+
+build_table() solves the game backwards from the last ply to the first and
+writes one fixed-size record per base-3 board index; SolutionTable memory-maps
+that file so each lookup is a single read.
+
+Usage: python solutions.py [path]
+"""
+
+import mmap
+import struct
+import sys
+
+import tictactoe as ttt
+
+DEFAULT_PATH = "solutions.bin"
+
+MAGIC = b"TTTS"
+VERSION = 1
+HEADER = struct.Struct("<4sBB")
+# value (-1, 0, 1), best move cell, plies to the end of the game
+RECORD = struct.Struct("<bBB")
+UNSOLVED = 127
+NO_MOVE = 255
+
+
+def reachable_levels():
+    """Returns, per number of pieces, the set of reachable (x, o) positions"""
+    levels = [set() for _ in range(ttt.CELLS + 1)]
+    levels[0].add((0, 0))
+    for count in range(ttt.CELLS):
+        for x, o in levels[count]:
+            state = ttt.GameState(x, o)
+            if state.terminal():
+                continue
+            for cell in range(ttt.CELLS):
+                if (x | o) >> cell & 1:
+                    continue
+                state.push(cell)
+                levels[count + 1].add((state.x, state.o))
+                state.pop(cell)
+    return levels
+
+
+def solve():
+    """
+    Returns {(x, o): (value, cell, distance)} for every reachable position.
+
+    Positions are solved from full boards back to the empty one, so every
+    child is known before its parent. Ties follow minimax: the fastest win,
+    the slowest loss, then the first move in actions() order.
+    """
+    solved = {}
+    for level in reversed(reachable_levels()):
+        for x, o in level:
+            state = ttt.GameState(x, o)
+            if state.terminal():
+                solved[(x, o)] = (state.utility(), None, 0)
+                continue
+            sign = 1 if state.turn == ttt.X else -1
+            best = None
+            for i, j in state.actions():
+                cell = i * ttt.SIZE + j
+                state.push(cell)
+                value, _, distance = solved[(state.x, state.o)]
+                state.pop(cell)
+                score = sign * value * (ttt.WIN_SCORE - distance - 1)
+                if best is None or score > best[0]:
+                    best = (score, value, cell, distance + 1)
+            solved[(x, o)] = best[1:]
+    return solved
+
+
+def build_table(path=DEFAULT_PATH):
+    """Solve the game and write the table to path; returns the positions solved"""
+    solved = solve()
+    data = bytearray(RECORD.pack(UNSOLVED, NO_MOVE, 0) * 3 ** ttt.CELLS)
+    for (x, o), (value, cell, distance) in solved.items():
+        RECORD.pack_into(data, ttt.base3_index(x, o) * RECORD.size,
+                         value, NO_MOVE if cell is None else cell, distance)
+    with open(path, "wb") as handle:
+        handle.write(HEADER.pack(MAGIC, VERSION, ttt.SIZE))
+        handle.write(data)
+    return len(solved)
+
+
+class SolutionTable:
+    """Read-only, memory-mapped view of a table written by build_table"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, "rb") as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION or size != ttt.SIZE:
+            self._map.close()
+            raise ValueError(f"{path} is not a {ttt.SIZE}x{ttt.SIZE} solution table")
+
+    def lookup(self, state):
+        """
+        Returns (value, action, distance) for the state, or None if the state
+        is not a reachable 3x3 position. action is None on finished games.
+        """
+        if state.geometry is not ttt.DEFAULT_GEOMETRY:
+            return None
+        offset = HEADER.size + ttt.base3_index(state.x, state.o) * RECORD.size
+        value, cell, distance = RECORD.unpack_from(self._map, offset)
+        if value == UNSOLVED:
+            return None
+        action = None if cell == NO_MOVE else divmod(cell, ttt.SIZE)
+        return value, action, distance
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# The table of this process, opened by open_process_table
+process_table = None
+
+
+def open_process_table(path):
+    """
+    Opens the table at path (if not None) as process_table; the
+    initializer of worker pools, so each worker maps the file once.
+    """
+    global process_table
+    if path is not None:
+        process_table = SolutionTable(path)
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH
+    print(f"Solved {build_table(target)} positions into {target}")
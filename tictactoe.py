@@ -3,7 +3,9 @@ Tic Tac Toe Player
 """
 
 import math
-import copy
+import sys
+import time
+from array import array
 
 result_key = "result"
 X = "X"
@@ -17,6 +19,9 @@ class Node:
         self.parent = parent
         self.children = []
         self.selected_children_prop = None
+        # Depth is kept up to date by add_child; the path is built on first use
+        self._depth = 0
+        self._path = None
         self.__dict__.update(kwargs)
 
         if parent is not None:
@@ -25,24 +30,50 @@ class Node:
     def add_child(self, node):
         self.children.append(node)
         node.parent = self
+        # A new node has no children yet; a moved one renumbers its subtree
+        stack = [(node, self._depth + 1)]
+        while stack:
+            moved, depth = stack.pop()
+            moved._depth = depth
+            moved._path = None
+            stack.extend((child, depth + 1) for child in moved.children)
 
     @property
     def depth(self):
-        d = 0
-        node = self.parent
-        while node is not None:
-            d += 1
-            node = node.parent
-        return d
+        return self._depth
 
     @property
     def path(self):
+        """Names from the root down to this node, joined by "/" """
+        if self._path is None:
+            # Climb to the nearest ancestor that knows its path, then fill in downwards
+            uncached = []
+            node = self
+            while node is not None and node._path is None:
+                uncached.append(node)
+                node = node.parent
+            for node in reversed(uncached):
+                name = str(node.name)
+                parent = node.parent
+                node._path = sys.intern(name if parent is None else parent._path + "/" + name)
+        return self._path
+
+    def find(self, path):
+        """Returns the node under this one with the given path relative to it, or None"""
         node = self
-        parts = []
-        while node:
-            parts.append(node.name)
-            node = node.parent
-        return "/".join(reversed(parts))
+        for name in path.split("/") if path else ():
+            node = next((child for child in node.children if str(child.name) == name), None)
+            if node is None:
+                return None
+        return node
+
+    def walk(self):
+        """Yields this node and all below it, depth-first"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
 
     @property
     def result(self):
@@ -63,6 +94,10 @@ class Node:
         """set current_best_value"""
         self.__dict__["selected_depth"] = self.depth
 
+    def set_selected_depth_value(self, depth):
+        """Set the selected depth without reaching a terminal node"""
+        self.__dict__["selected_depth"] = depth
+
     @property
     def get_selected(self):
         """set current_best_value"""
@@ -108,67 +143,847 @@ class Node:
         return self._display()
 
     def _display(self, level=0):
-        indent = "  " * level
-        result = f"{indent}- {self.name} (depth: {self.depth})\n"
-        for child in self.children:
-            result += child._display(level + 1)
-        return result
+        base = self._depth - level
+        return "".join(f"{'  ' * (node._depth - base)}- {node.name} (depth: {node._depth})\n"
+                       for node in self.walk())
 
-def initial_state():
+def _additive_tables(weights):
     """
-    Returns starting state of the board.
+    Lookup tables that sum per-cell weights over a bitmask, nine cells at a
+    time: value(bits) is the sum of tables[c][(bits >> 9 * c) & 511].
     """
-    return [[EMPTY, EMPTY, EMPTY],
-            [EMPTY, EMPTY, EMPTY],
-            [EMPTY, EMPTY, EMPTY]]
+    tables = []
+    for offset in range(0, len(weights), 9):
+        chunk = weights[offset:offset + 9]
+        table = [0] * (1 << len(chunk))
+        for bits in range(1, len(table)):
+            low = bits & -bits
+            table[bits] = table[bits ^ low] + chunk[low.bit_length() - 1]
+        tables.append(table)
+    return tuple(tables)
+
+
+def _sum_tables(tables, bits):
+    total = 0
+    for table in tables:
+        total += table[bits & 511]
+        bits >>= 9
+    return total
+
+
+class Geometry:
+    """
+    Board size, winning line length and the tables derived from them.
 
-def player(board):
+    Cell (i, j) is bit i * size + j of a per-player mask. Use get_geometry
+    so that every board of the same shape shares one instance, and with it
+    one transposition table.
     """
-    Returns player who has the next turn on a board.
+
+    def __init__(self, size=3, k=None):
+        if k is None:
+            k = min(size, 4)
+        if size < 1 or not 1 <= k <= size:
+            raise ValueError(f"Cannot play {k} in a row on a {size}x{size} board")
+        self.size = size
+        self.k = k
+        self.cells = size * size
+        self.full_mask = (1 << self.cells) - 1
+        self.win_masks = self._line_masks()
+        # Winning lines through each cell, so a move only checks its own lines
+        self.cell_lines = tuple(
+            tuple(mask for mask in self.win_masks if mask >> cell & 1)
+            for cell in range(self.cells)
+        )
+        self.symmetries = self._symmetries()
+        self.inverse_symmetries = tuple(
+            tuple(permutation.index(cell) for cell in range(self.cells))
+            for permutation in self.symmetries
+        )
+        self._symmetry_tables = tuple(
+            _additive_tables([1 << target for target in permutation])
+            for permutation in self.symmetries
+        )
+        self._base3_tables = _additive_tables([3 ** cell for cell in range(self.cells)])
+        # Cells on more lines first, then the more central ones: on 3x3 the
+        # center, the corners and then the edges
+        center = (size - 1) / 2
+        self.move_order = tuple(sorted(
+            range(self.cells),
+            key=lambda cell: (-len(self.cell_lines[cell]),
+                              abs(cell // size - center) + abs(cell % size - center),
+                              cell)))
+        # Scores rank a result reached `distance` plies below the root: the
+        # faster a win (and the slower a loss) the larger its magnitude.
+        # Heuristic scores stay strictly between -1 and 1.
+        self.win_score = self.cells + 1
+        self._line_weights = tuple(4 ** pieces - 1 for pieces in range(self.k + 1))
+        self._evaluation_scale = 2 * len(self.win_masks) * 4 ** self.k
+        self.table = TranspositionTable(self)
+
+    def __reduce__(self):
+        return get_geometry, (self.size, self.k)
+
+    def __repr__(self):
+        return f"Geometry(size={self.size}, k={self.k})"
+
+    def cell_bit(self, i, j):
+        """Returns the single-bit mask of cell (i, j)"""
+        return 1 << (i * self.size + j)
+
+    def _line_masks(self):
+        size, k = self.size, self.k
+        lines = []
+        for i in range(size):
+            for j in range(size):
+                for di, dj in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                    end_i, end_j = i + di * (k - 1), j + dj * (k - 1)
+                    if 0 <= end_i < size and 0 <= end_j < size:
+                        lines.append(sum(self.cell_bit(i + di * step, j + dj * step)
+                                         for step in range(k)))
+        return tuple(lines)
+
+    def _symmetries(self):
+        """Cell permutations of the 8 rotations/reflections of the board"""
+        last = self.size - 1
+        transforms = [
+            lambda i, j: (i, j),
+            lambda i, j: (j, last - i),
+            lambda i, j: (last - i, last - j),
+            lambda i, j: (last - j, i),
+            lambda i, j: (i, last - j),
+            lambda i, j: (last - i, j),
+            lambda i, j: (j, i),
+            lambda i, j: (last - j, last - i),
+        ]
+        permutations = []
+        for transform in transforms:
+            permutation = [0] * self.cells
+            for i in range(self.size):
+                for j in range(self.size):
+                    ti, tj = transform(i, j)
+                    permutation[i * self.size + j] = ti * self.size + tj
+            permutations.append(tuple(permutation))
+        return tuple(permutations)
+
+    def line_complete(self, bits):
+        """Returns True if the bitmask covers any winning line"""
+        for mask in self.win_masks:
+            if bits & mask == mask:
+                return True
+        return False
+
+    def scan(self, mover, rival):
+        """
+        Returns (wins, blocks, alive) for the side owning `mover`: the cells
+        that complete one of its lines, the cells the rival would complete a
+        line on, and whether any line can still be completed by anyone.
+        """
+        wins = blocks = 0
+        alive = False
+        for mask in self.win_masks:
+            if not mask & rival:
+                alive = True
+                missing = mask ^ (mask & mover)
+                if missing & (missing - 1) == 0:
+                    wins |= missing
+            elif not mask & mover:
+                alive = True
+                missing = mask ^ (mask & rival)
+                if missing & (missing - 1) == 0:
+                    blocks |= missing
+        return wins, blocks, alive
+
+    def evaluate(self, x, o):
+        """
+        Heuristic score of an unfinished position from X's point of view:
+        lines still open to a player count for it, more so the more pieces
+        it already has on them. The result lies between -0.5 and 0.5.
+        """
+        weights = self._line_weights
+        total = 0
+        for mask in self.win_masks:
+            if not mask & o:
+                total += weights[(mask & x).bit_count()]
+            if not mask & x:
+                total -= weights[(mask & o).bit_count()]
+        return total / self._evaluation_scale
+
+    def canonical_key(self, x, o):
+        """
+        Returns (key, symmetry) where key identifies the position up to
+        rotation and reflection, and symmetry is the index in symmetries that
+        maps the given position onto the canonical one.
+        """
+        cells = self.cells
+        best_key = None
+        best_symmetry = 0
+        for symmetry, tables in enumerate(self._symmetry_tables):
+            if len(tables) == 1:
+                table = tables[0]
+                key = table[x] | (table[o] << cells)
+            else:
+                key = _sum_tables(tables, x) | (_sum_tables(tables, o) << cells)
+            if best_key is None or key < best_key:
+                best_key = key
+                best_symmetry = symmetry
+        return best_key, best_symmetry
+
+    def base3_index(self, x, o):
+        """Returns the base-3 encoding of a position: 0 empty, 1 X, 2 O per cell"""
+        return _sum_tables(self._base3_tables, x) + 2 * _sum_tables(self._base3_tables, o)
+
+
+_GEOMETRIES = {}
+
+
+def get_geometry(size=3, k=None):
+    """Returns the shared Geometry of a size x size board with k in a row"""
+    if k is None:
+        k = min(size, 4)
+    geometry = _GEOMETRIES.get((size, k))
+    if geometry is None:
+        geometry = _GEOMETRIES[(size, k)] = Geometry(size, k)
+    return geometry
+
+
+def _invalidating(method):
+    """Wraps a list method so that calling it forgets the owning board's cached state"""
+    def mutate(self, *args):
+        self._invalidate()
+        return method(self, *args)
+    mutate.__name__ = method.__name__
+    return mutate
+
+
+_LIST_MUTATORS = ("__setitem__", "__delitem__", "__iadd__", "__imul__", "append", "extend",
+                  "insert", "pop", "remove", "clear", "sort", "reverse")
+
+
+class BoardRow(list):
+    """Row of a Board; writing to it forgets the board's cached state"""
+    __slots__ = ("_board",)
+
+    def __init__(self, cells=(), board=None):
+        super().__init__(cells)
+        self._board = board
+
+    def _invalidate(self):
+        # Unpickling fills the row before it has a board
+        board = getattr(self, "_board", None)
+        if board is not None:
+            board._state = None
+
+
+for _name in _LIST_MUTATORS:
+    setattr(BoardRow, _name, _invalidating(getattr(list, _name)))
+
+
+class Board(list):
+    """
+    List-of-lists board that remembers the geometry it is played on, and
+    caches its GameState until the board or one of its rows is changed.
     """
 
+    def __init__(self, rows=(), geometry=None):
+        super().__init__(BoardRow(row, self) for row in rows)
+        self.geometry = geometry if geometry is not None else get_geometry(len(self))
+        self._state = None
 
-    if terminal(board):
-        return "The game is already over"
+    def _invalidate(self):
+        self._state = None
 
-    x_movements = 0
-    o_movements = 0
-    for rows in board:
-        for cell in rows:
-            if cell == X:
-                x_movements = x_movements + 1
-            elif cell == O:
-                o_movements = o_movements + 1
-
-    current_player = None
-    if x_movements < o_movements or x_movements == o_movements:
-        current_player = X
-    else:
-        current_player = O
+    def _row(self, row):
+        return row if isinstance(row, BoardRow) and row._board is self else BoardRow(row, self)
 
-    return current_player
+    def __setitem__(self, index, value):
+        self._state = None
+        if isinstance(index, slice):
+            value = [self._row(row) for row in value]
+        else:
+            value = self._row(value)
+        super().__setitem__(index, value)
 
-def actions(board):
+    def append(self, row):
+        self._state = None
+        super().append(self._row(row))
+
+    def insert(self, index, row):
+        self._state = None
+        super().insert(index, self._row(row))
+
+    def extend(self, rows):
+        self._state = None
+        super().extend(self._row(row) for row in rows)
+
+    def __iadd__(self, rows):
+        self.extend(rows)
+        return self
+
+    def state(self):
+        """The board's GameState, shared: copy it before playing moves on it"""
+        state = self._state
+        if state is None:
+            state = self._state = GameState.from_board(self)
+        return state
+
+
+for _name in ("__delitem__", "__imul__", "pop", "remove", "clear", "sort", "reverse"):
+    setattr(Board, _name, _invalidating(getattr(list, _name)))
+
+
+def game_state(board):
     """
-    Returns set of all possible actions (i, j) available on the board.
+    Returns the GameState of a board, cached on Boards. It is shared with
+    the board, so it must not be changed.
+    """
+    if isinstance(board, Board):
+        return board.state()
+    return GameState.from_board(board)
+
+
+def board_geometry(board):
+    """Returns the geometry of a board; plain lists use the default k"""
+    geometry = getattr(board, "geometry", None)
+    return geometry if geometry is not None else get_geometry(len(board))
+
+
+class GameState:
+    """Compact bitboard state: one bitmask per player plus the side to move"""
+    __slots__ = ("x", "o", "turn", "count", "won", "geometry")
+
+    def __init__(self, x=0, o=0, turn=None, geometry=None):
+        if geometry is None:
+            geometry = DEFAULT_GEOMETRY
+        self.geometry = geometry
+        self.x = x
+        self.o = o
+        if turn is None:
+            turn = X if x.bit_count() <= o.bit_count() else O
+        self.turn = turn
+        self.count = (x | o).bit_count()
+        self.won = X if geometry.line_complete(x) else O if geometry.line_complete(o) else None
+
+    def copy(self):
+        state = GameState.__new__(GameState)
+        state.x = self.x
+        state.o = self.o
+        state.turn = self.turn
+        state.count = self.count
+        state.won = self.won
+        state.geometry = self.geometry
+        return state
+
+    @classmethod
+    def from_board(cls, board):
+        """Build the bitboard state from a list-of-lists board"""
+        x = o = 0
+        bit = 1
+        for rows in board:
+            for cell in rows:
+                if cell == X:
+                    x |= bit
+                elif cell == O:
+                    o |= bit
+                bit <<= 1
+        return cls(x, o, geometry=board_geometry(board))
+
+    def to_board(self):
+        """Return the list-of-lists board for this state"""
+        geometry = self.geometry
+        board = Board(geometry=geometry)
+        for i in range(geometry.size):
+            row = []
+            for j in range(geometry.size):
+                bit = geometry.cell_bit(i, j)
+                row.append(X if self.x & bit else O if self.o & bit else EMPTY)
+            board.append(row)
+        return board
+
+    def empties(self):
+        """Bitmask of the empty cells"""
+        return self.geometry.full_mask & ~(self.x | self.o)
+
+    def actions(self):
+        """Set of (i, j) for every empty cell"""
+        free = self.empties()
+        size = self.geometry.size
+        moves = set()
+        while free:
+            bit = free & -free
+            moves.add(divmod(bit.bit_length() - 1, size))
+            free ^= bit
+        return moves
+
+    def winner(self):
+        return self.won
+
+    def terminal(self):
+        return self.won is not None or self.count == self.geometry.cells
+
+    def push(self, cell):
+        """Play the side to move on an empty cell, in place"""
+        bit = 1 << cell
+        if self.turn == X:
+            self.x |= bit
+            bits = self.x
+            self.turn = O
+        else:
+            self.o |= bit
+            bits = self.o
+            self.turn = X
+        self.count += 1
+        for mask in self.geometry.cell_lines[cell]:
+            if bits & mask == mask:
+                self.won = X if self.turn == O else O
+                break
+
+    def pop(self, cell):
+        """Take back the last move, which was played on cell"""
+        bit = 1 << cell
+        if self.turn == X:
+            self.o ^= bit
+            self.turn = O
+        else:
+            self.x ^= bit
+            self.turn = X
+        self.count -= 1
+        self.won = None
+
+    def packed(self):
+        """Both masks in one integer: x | o << cells"""
+        return self.x | self.o << self.geometry.cells
+
+    def utility(self):
+        winner_state = self.winner()
+        if winner_state == X:
+            return 1
+        if winner_state == O:
+            return -1
+        return 0
+
+    def __eq__(self, other):
+        return (isinstance(other, GameState)
+                and (self.x, self.o, self.turn, self.geometry)
+                == (other.x, other.o, other.turn, other.geometry))
+
+    def __hash__(self):
+        return hash((self.x, self.o, self.turn))
+
+    def __repr__(self):
+        width = self.geometry.cells + 2
+        return f"GameState(x={self.x:#0{width}b}, o={self.o:#0{width}b}, turn={self.turn!r})"
+
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Draft of a result that no search horizon cut short
+PROVEN = math.inf
+
+
+def relative_score(score, ply):
+    """Re-express a score found `ply` plies below the root from its own node"""
+    if score >= 1:
+        return score + ply
+    if score <= -1:
+        return score - ply
+    return score
+
+
+class TableEntry:
+    """
+    Transposition table entry. The score is seen from the entry's own
+    position, so a win or loss keeps its depth-to-result wherever the
+    position shows up again; draft is how many plies were searched below it.
+    """
+    __slots__ = ("key", "score", "draft", "flag", "move")
+
+    def __init__(self, key, score, draft, flag, move):
+        self.key = key
+        self.score = score
+        self.draft = draft
+        self.flag = flag
+        self.move = move
+
+    def score_at(self, ply):
+        """Score of this entry for a node found `ply` plies below the root"""
+        return relative_score(self.score, -ply)
+
+
+# Slots of a transposition table, a prime so that keys spread over them
+TABLE_SLOTS = 262_139
+
+
+class TranspositionTable:
+    """
+    Search results keyed by canonical position, kept for the whole process.
+
+    A key goes to slot key % slots, which holds two entries: the deepest
+    result that reached it and the latest other one. A long-lived process
+    thus keeps at most 2 * slots entries, and a deep result is only pushed
+    out by one at least as deep.
+    """
+
+    def __init__(self, geometry, slots=TABLE_SLOTS):
+        self.geometry = geometry
+        self.slots = slots
+        self.deep = {}
+        self.recent = {}
+        self.hits = 0
+
+    def __len__(self):
+        return len(self.deep) + len(self.recent)
+
+    def lookup(self, key):
+        """Return the entry stored under a canonical key, or None"""
+        index = key % self.slots
+        entry = self.deep.get(index)
+        if entry is None or entry.key != key:
+            entry = self.recent.get(index)
+            if entry is None or entry.key != key:
+                return None
+        self.hits += 1
+        return entry
+
+    def save(self, key, symmetry, score, draft, flag, move):
+        """Record a result; move is a cell index before applying the symmetry"""
+        index = key % self.slots
+        deep = self.deep.get(index)
+        recent = self.recent.get(index)
+        if deep is not None and deep.key == key:
+            previous = deep
+        elif recent is not None and recent.key == key:
+            previous = recent
+        else:
+            previous = None
+        if previous is not None and previous.draft > draft:
+            # Keep the result of the deeper search
+            return
+        if move is not None:
+            move = self.geometry.symmetries[symmetry][move]
+        entry = TableEntry(key, score, draft, flag, move)
+        if deep is None or deep is previous or draft >= deep.draft:
+            if deep is not None and deep is not previous:
+                # The deep entry it replaces becomes the slot's latest other one
+                self.recent[index] = deep
+            elif recent is not None and recent is previous:
+                del self.recent[index]
+            self.deep[index] = entry
+        else:
+            self.recent[index] = entry
+
+    def best_move(self, state):
+        """Return the stored best move (i, j) for the state, if any"""
+        key, symmetry = self.geometry.canonical_key(state.x, state.o)
+        entry = self.lookup(key)
+        if entry is None or entry.move is None:
+            return None
+        cell = self.geometry.inverse_symmetries[symmetry][entry.move]
+        return divmod(cell, self.geometry.size)
+
+    def clear(self):
+        self.deep.clear()
+        self.recent.clear()
+        self.hits = 0
+
+
+DEFAULT_GEOMETRY = get_geometry(3)
+SIZE = DEFAULT_GEOMETRY.size
+CELLS = DEFAULT_GEOMETRY.cells
+WIN_SCORE = DEFAULT_GEOMETRY.win_score
+TRANSPOSITION_TABLE = DEFAULT_GEOMETRY.table
+
+
+def canonical_key(x, o, geometry=DEFAULT_GEOMETRY):
+    """Returns (key, symmetry) of a position, see Geometry.canonical_key"""
+    return geometry.canonical_key(x, o)
+
+
+def base3_index(x, o, geometry=DEFAULT_GEOMETRY):
+    """Returns the base-3 encoding of a position, see Geometry.base3_index"""
+    return geometry.base3_index(x, o)
+
+
+def score_result(score, ply, count, geometry=DEFAULT_GEOMETRY):
+    """
+    Returns (value, selected_depth) for a score found `ply` plies below the
+    root of a search, on a position holding `count` pieces.
+    """
+    if score >= 1:
+        return 1, geometry.win_score - score
+    if score <= -1:
+        return -1, geometry.win_score + score
+    # A draw (or an unresolved position) is only counted once the board is full
+    return 0, ply + geometry.cells - count
+
+
+class SearchTree:
+    """
+    Array-backed record of the positions expanded by one search.
+
+    Nodes are indices: boards are packed as x | o << cells, links to parents,
+    first children and next siblings are indices (-1 for none), and scores
+    are relative to the root of the search.
+    """
+    __slots__ = ("geometry", "boards", "parents", "cells", "scores", "first_child",
+                 "next_sibling", "last_child", "selected")
+
+    def __init__(self, geometry=DEFAULT_GEOMETRY):
+        self.geometry = geometry
+        # Packed boards outgrow a signed 64-bit slot past 5x5
+        self.boards = array("q") if 2 * geometry.cells < 64 else []
+        self.parents = array("i")
+        # Cell indices pass a signed byte from 12x12 on
+        self.cells = array("h")
+        self.scores = array("d")
+        self.first_child = array("i")
+        self.next_sibling = array("i")
+        self.last_child = array("i")
+        self.selected = array("i")
+
+    def __len__(self):
+        return len(self.boards)
+
+    def add(self, board, parent=-1, cell=-1):
+        """Append a node and return its index"""
+        index = len(self.boards)
+        self.boards.append(board)
+        self.parents.append(parent)
+        self.cells.append(cell)
+        self.scores.append(0)
+        self.first_child.append(-1)
+        self.next_sibling.append(-1)
+        self.last_child.append(-1)
+        self.selected.append(-1)
+        if parent >= 0:
+            if self.first_child[parent] < 0:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[self.last_child[parent]] = index
+            self.last_child[parent] = index
+        return index
+
+    def children(self, index):
+        """Return the indices of the children of a node"""
+        nodes = []
+        child = self.first_child[index]
+        while child >= 0:
+            nodes.append(child)
+            child = self.next_sibling[child]
+        return nodes
+
+    def depth(self, index):
+        return (self.boards[index].bit_count()
+                - self.boards[0].bit_count())
+
+    def action(self, index):
+        """Return the (i, j) played to reach the node, None for the root"""
+        cell = self.cells[index]
+        return None if cell < 0 else divmod(cell, self.geometry.size)
+
+    def state(self, index):
+        board = self.boards[index]
+        geometry = self.geometry
+        return GameState(board & geometry.full_mask, board >> geometry.cells, geometry=geometry)
+
+    def result(self, index):
+        """Return (value, selected_depth) of the node"""
+        state = self.state(index)
+        return score_result(self.scores[index], self.depth(index), state.count, self.geometry)
+
+    def to_node(self, index=0, parent=None, name=None):
+        """Rebuild the subtree under index as Node objects"""
+        state = self.state(index)
+        value, selected_depth = self.result(index)
+        current_player = O if state.turn == X else X
+        if name is None:
+            name = current_player = state.turn
+        node = Node(name, current_player=current_player, action=self.action(index),
+                    board_result=state.to_board(), result=value, score=self.scores[index],
+                    selected=1 if index and self.selected[self.parents[index]] == index else None,
+                    parent=parent)
+        node.set_selected_depth_value(selected_depth)
+        for i, child in enumerate(self.children(index)):
+            self.to_node(child, node, str(i) + state.turn)
+        return node
+
+
+class SearchBudgetExhausted(Exception):
+    """Raised inside play when a search runs out of time or nodes, or is stopped"""
+
+
+class Search:
+    """Per-call state threaded through play"""
+    __slots__ = ("geometry", "table", "root_count", "tree", "best_cell",
+                 "depth_limit", "nodes", "max_nodes", "deadline",
+                 "ordering", "killers", "history", "info", "stop", "hooks")
+
+    def __init__(self, state, tree=None, max_nodes=None, deadline=None, ordering=True,
+                 info=None, stop=None, hooks=None):
+        self.geometry = state.geometry
+        self.table = state.geometry.table
+        self.root_count = state.count
+        self.tree = tree
+        self.best_cell = None
+        self.depth_limit = PROVEN
+        self.nodes = 0
+        self.max_nodes = max_nodes if max_nodes is not None else math.inf
+        self.deadline = deadline if deadline is not None else math.inf
+        self.ordering = ordering
+        # Two moves per ply that last caused a cutoff, and per-side counts
+        # of how much search each cell's cutoffs saved
+        self.killers = [[-1, -1] for _ in range(state.geometry.cells + 1)]
+        self.history = ([0] * state.geometry.cells, [0] * state.geometry.cells)
+        self.info = info
+        self.stop = stop
+        self.hooks = hooks
+
+    def count_node(self):
+        self.nodes += 1
+        if self.nodes >= self.max_nodes:
+            raise SearchBudgetExhausted()
+        if not self.nodes & 255:
+            # Every 256 nodes: report progress and look at the clock
+            if self.info is not None:
+                self.info.nodes = self.nodes
+            if (time.perf_counter() >= self.deadline
+                    or (self.stop is not None and self.stop.is_set())):
+                raise SearchBudgetExhausted()
+
+
+class SearchInfo:
+    """
+    What a minimax call found, filled in when passed as info=. The nodes,
+    depth and move of the deepest finished iteration are also kept up to
+    date while the search runs, so another thread can show progress.
+    """
+    __slots__ = ("move", "score", "value", "distance", "depth", "nodes", "completed")
+
+    def __init__(self):
+        self.move = None
+        self.score = None
+        self.value = None
+        # Plies to the end of the game under best play, once the value is known
+        self.distance = None
+        self.depth = 0
+        self.nodes = 0
+        self.completed = False
+
+    def __repr__(self):
+        return (f"SearchInfo(move={self.move}, value={self.value}, distance={self.distance}, "
+                f"depth={self.depth}, nodes={self.nodes}, completed={self.completed})")
+
+
+class SearchHooks:
+    """
+    Callbacks from inside a search, passed to minimax as hooks=.
+
+    Every method does nothing; override the ones a sampler or tracer needs.
+    ply counts the moves made since the root of the search.
     """
 
-    empty_cells = 0
-    for rows in board:
-        for cell in rows:
-            if cell == EMPTY:
-                empty_cells = empty_cells + 1
-    if empty_cells < 1:
+    def node(self, state, ply):
+        """A position is about to be searched"""
+
+    def terminal(self, state, ply):
+        """The position is a finished game"""
+
+    def table_hit(self, state, ply, score):
+        """The transposition table settled the position without a search"""
+
+    def cutoff(self, state, ply, cell):
+        """The move at cell refuted the position, pruning the moves after it"""
+
+    def iteration(self, depth, score, seconds, completed):
+        """
+        A search to depth finished (completed) or ran out of budget. Searches
+        without a budget make one iteration, with depth PROVEN.
+        """
+
+
+class SearchStats(SearchHooks):
+    """Counts what a search did, indexed by ply where it applies"""
+
+    def __init__(self):
+        self.nodes_per_ply = []
+        self.cutoffs_per_ply = []
+        self.terminal_hits = 0
+        self.table_hits = 0
+        self.ply_times = []
+
+    @property
+    def nodes(self):
+        return sum(self.nodes_per_ply)
+
+    @property
+    def cutoffs(self):
+        return sum(self.cutoffs_per_ply)
+
+    def node(self, state, ply):
+        while len(self.nodes_per_ply) <= ply:
+            self.nodes_per_ply.append(0)
+            self.cutoffs_per_ply.append(0)
+        self.nodes_per_ply[ply] += 1
+
+    def terminal(self, state, ply):
+        self.terminal_hits += 1
+
+    def table_hit(self, state, ply, score):
+        self.table_hits += 1
+
+    def cutoff(self, state, ply, cell):
+        self.cutoffs_per_ply[ply] += 1
+
+    def iteration(self, depth, score, seconds, completed):
+        self.ply_times.append((depth, seconds))
+
+    def as_dict(self):
+        return {
+            "nodes": self.nodes,
+            "nodes_per_ply": self.nodes_per_ply,
+            "cutoffs_per_ply": self.cutoffs_per_ply,
+            "terminal_hits": self.terminal_hits,
+            "table_hits": self.table_hits,
+            "ply_times": [[None if depth is PROVEN else depth, seconds]
+                          for depth, seconds in self.ply_times],
+        }
+
+    def __repr__(self):
+        return (f"SearchStats(nodes={self.nodes}, terminal_hits={self.terminal_hits}, "
+                f"table_hits={self.table_hits}, cutoffs={self.cutoffs})")
+
+
+def initial_state(size=3, k=None):
+    """
+    Returns starting state of the board.
+
+    Boards are size x size and won with k in a row (k defaults to the board
+    size, capped at 4).
+    """
+    geometry = get_geometry(size, k)
+    return Board([[EMPTY] * size for _ in range(size)], geometry)
+
+def player(board):
+    """
+    Returns player who has the next turn on a board.
+    """
+    state = game_state(board)
+    if state.terminal():
         return "The game is already over"
 
-    possible_actions = set()
+    return state.turn
 
-    for i, rows in enumerate(board):
-        for j, cell in enumerate(rows):
-            if cell == EMPTY:
-                possible_actions.add((i, j))
+def actions(board):
+    """
+    Returns set of all possible actions (i, j) available on the board.
+    """
+    state = game_state(board)
+    if not state.empties():
+        return "The game is already over"
 
-    return possible_actions
+    return state.actions()
 
 def valid_action_in_board(board, action):
     """Returns if the action is a valid move in a given board"""
@@ -179,36 +994,38 @@ def result(board, action):
     Returns the board that results from making move (i, j) on the board.
     """
 
+    if board is None:
+        raise ValueError("The action is not valid")
+
+    size = len(board)
     if (action is None
-        or board is None
         or not isinstance(action, tuple)
         or len(action) != 2
-        or action[0] > 2 or action[0] < 0 or not isinstance(action[0], int)
-        or action[1] > 2 or action[1] < 0 or not isinstance(action[1], int)
+        or action[0] >= size or action[0] < 0 or not isinstance(action[0], int)
+        or action[1] >= size or action[1] < 0 or not isinstance(action[1], int)
         or not valid_action_in_board(board, action)):
 
         raise ValueError("The action is not valid")
 
-    current_player = player(board)
-    new_board = copy.deepcopy(board)
+    state = game_state(board)
+    current_player = "The game is already over" if state.terminal() else state.turn
+    new_board = Board(board, state.geometry)
     row, cell = action
     new_board[row][cell] = current_player
+    if not state.terminal():
+        # Carry the state over one move instead of rescanning the new board
+        new_state = state.copy()
+        new_state.push(row * state.geometry.size + cell)
+        new_board._state = new_state
 
     return new_board
 
 def board_match(board, player):
-    for i in range(3):
-        # Check rows and columns
-        if all(board[i][j] == player for j in range(3)):
-            return player
-        if all(board[j][i] == player for j in range(3)):
-            return player
-
-        # Check diagonals
-        if all(board[i][i] == player for i in range(3)):
-            return player
-        if all(board[i][2 - i] == player for i in range(3)):
-            return player
+    """Returns player if it owns a complete line on the board, otherwise None"""
+    state = game_state(board)
+    bits = state.x if player == X else state.o
+    if state.geometry.line_complete(bits):
+        return player
 
     # IF there's no winner
     return None
@@ -217,122 +1034,405 @@ def winner(board):
     """
     Returns the winner of the game, if there is one.
     """
-    if board_match(board, X) is not None:
-        return X
-    elif board_match(board, O) is not None:
-        return O
-
-    # IF there's no winner
-    return None
+    return game_state(board).winner()
 
 def terminal(board):
     """
     Returns True if game is over, False otherwise.
     """
-    terminal_board = True
-    for rows in board:
-        for cell in rows:
-            if cell == EMPTY:
-                terminal_board = False
-
-    winner_board = None
-    if not terminal_board:
-        winner_board = winner(board)
-
-    return terminal_board or bool(winner_board)
+    return game_state(board).terminal()
 
 def utility(board):
     """
     Returns 1 if X has won the game, -1 if O has won, 0 otherwise.
     """
+    return game_state(board).utility()
 
-    winner_board = winner(board)
-    result = None
-    if winner_board == X:
-        result = 1
-    elif winner_board == O:
-        result = -1
-    else:
-        result = 0
+def _lower_score(score, current_best_score):
+    return score < current_best_score
 
-    return result
-
-def min_player(board, node, alpha, beta):
-    """Look the best move to score the minimum possible value with alpha-beta pruning"""
+def _higher_score(score, current_best_score):
+    return score > current_best_score
 
-    def check_better(min_node, current_best_max_value):
-        return min_node.result < current_best_max_value.result
+def _lower_beta(alpha, beta, current_best_score):
+    return alpha, min(beta, current_best_score)
 
-    def pruning(alpha, beta, current_best_result):
-        beta = min(beta, current_best_result)
-        return alpha, beta
+def _raise_alpha(alpha, beta, current_best_score):
+    return max(alpha, current_best_score), beta
 
-    return play(board, node, alpha, beta, pruning, O, max_player, check_better)
+def min_player(state, node, alpha, beta, search):
+    """Look the best move to score the minimum possible value with alpha-beta pruning"""
+    return play(state, node, alpha, beta, _lower_beta, O, max_player, _lower_score, search)
 
 
-def max_player(board, node, alpha, beta):
+def max_player(state, node, alpha, beta, search):
     """Look the best move to score the maximum possible value with alpha-beta pruning"""
-    def check_better(min_node, current_best_max_value):
-        return min_node.result > current_best_max_value.result
-    def pruning(alpha, _, current_best_result):
-        alpha = max(alpha, current_best_result)
-        return alpha, beta
-
-    return play(board, node, alpha, beta, pruning, X, min_player, check_better)
-
-def play(board, node, alpha, beta, beta_func, current_player, play_player, check_better):
-    """Execute play action"""
-    if terminal(board):
-        node.set_result(utility(board))
-        node.set_selected_depth()
-        return node
+    return play(state, node, alpha, beta, _raise_alpha, X, min_player, _higher_score, search)
 
-    current_best = node
+def order_moves(state, search, ply, remaining, entry, symmetry, threats):
+    """
+    Returns the empty cells in the order to search them: the transposition
+    table's move (the previous iteration's best, when deepening), moves that
+    win or block a line, then the geometry's positional order.
 
-    for i, action in enumerate(actions(board)):
-        board_result = result(board, action)
+    Above a heuristic horizon the killer moves of the ply come next and the
+    rest are sorted by history. Cells mean little from one exhaustively
+    solved position to the next, so there they cost more nodes than they save.
+    """
+    geometry = search.geometry
+    occupied = state.x | state.o
+    if not search.ordering:
+        return [cell for cell in range(geometry.cells) if not occupied >> cell & 1]
+
+    moves = [cell for cell in geometry.move_order if not occupied >> cell & 1]
+    heuristic = remaining is not PROVEN
+    if heuristic:
+        history = search.history[0 if state.turn == X else 1]
+        moves.sort(key=history.__getitem__, reverse=True)
+
+    front = []
+    if entry is not None and entry.move is not None:
+        front.append(geometry.inverse_symmetries[symmetry][entry.move])
+    while threats:
+        bit = threats & -threats
+        front.append(bit.bit_length() - 1)
+        threats ^= bit
+    if heuristic:
+        front.extend(search.killers[ply])
+    for cell in reversed(front):
+        if cell >= 0 and not occupied >> cell & 1:
+            moves.remove(cell)
+            moves.insert(0, cell)
+    return moves
+
+def play(state, node, alpha, beta, beta_func, current_player, play_player, check_better, search):
+    """
+    Execute play action and return the score of the state.
 
-        sub_node = Node(str(i) + current_player, current_player=current_player, action=action, board_result=board_result, result=None, selected=None, parent=node)
+    The search applies and takes back moves on the one mutable state, so the
+    state is left exactly as it was given once play returns. node is the
+    index of the state in search.tree, or None when no tree is recorded.
+    Positions search.depth_limit plies below the root are scored with the
+    geometry's heuristic instead of being expanded.
+    """
+    search.count_node()
+    geometry = search.geometry
+    ply = state.count - search.root_count
+    tree = search.tree
+    hooks = search.hooks
+    if hooks is not None:
+        hooks.node(state, ply)
+    if state.terminal():
+        if hooks is not None:
+            hooks.terminal(state, ply)
+        score = state.utility() * (geometry.win_score - ply)
+        if node is not None:
+            tree.scores[node] = score
+        return score
+
+    key, symmetry = geometry.canonical_key(state.x, state.o)
+    sign = 1 if current_player == X else -1
+    remaining = search.depth_limit - ply
+    if remaining >= geometry.cells - state.count:
+        # The horizon is out of reach, so the result will be exact
+        remaining = PROVEN
+
+    order = None
+    entry = None
+    threats = 0
+
+    if ply == 0:
+        if remaining is PROVEN:
+            # The exact root searches every action in actions() order, so a
+            # move only replaces the best one when it scores strictly better.
+            # Searching them in another order would have to prove every tie.
+            order = [i * geometry.size + j for i, j in state.actions()]
+        else:
+            # Below a horizon the move is a heuristic pick anyway, so the root
+            # is ordered like any node: the previous iteration's best first
+            entry = search.table.lookup(key)
+            mover, rival = (state.x, state.o) if current_player == X else (state.o, state.x)
+            wins, blocks, _alive = geometry.scan(mover, rival)
+            threats = wins | blocks
+    else:
+        score = None
+        entry = search.table.lookup(key)
+        if entry is not None and entry.draft >= remaining:
+            score = entry.score_at(ply)
+            if not (entry.flag == EXACT
+                    or (entry.flag == LOWER and score >= beta)
+                    or (entry.flag == UPPER and score <= alpha)):
+                score = None
+            elif hooks is not None:
+                hooks.table_hit(state, ply, score)
+        if score is None:
+            mover, rival = (state.x, state.o) if current_player == X else (state.o, state.x)
+            wins, blocks, alive = geometry.scan(mover, rival)
+            threats = wins | blocks
+            if wins:
+                # Win on the next move
+                score = sign * (geometry.win_score - ply - 1)
+            elif blocks & (blocks - 1):
+                # Two threats cannot both be blocked
+                score = -sign * (geometry.win_score - ply - 2)
+            elif not alive:
+                # Nobody can complete a line any more
+                score = 0
+            elif remaining <= 0:
+                score = geometry.evaluate(state.x, state.o)
+            elif blocks:
+                order = (blocks.bit_length() - 1,)
+        if score is not None:
+            if node is not None:
+                tree.scores[node] = score
+            return score
+
+    if order is None:
+        order = order_moves(state, search, ply, remaining, entry, symmetry, threats)
+
+    alpha_origin, beta_origin = alpha, beta
+    best_score = None
+    best_cell = None
+
+    for cell in order:
+        state.push(cell)
+        sub_node = None if tree is None else tree.add(state.packed(), node, cell)
+        score = play_player(state, sub_node, alpha, beta, search)
+        state.pop(cell)
+
+        if best_score is None or check_better(score, best_score):
+            if tree is not None:
+                tree.selected[node] = sub_node
+            best_score = score
+            best_cell = cell
+            if ply == 0:
+                search.best_cell = best_cell
+            alpha, beta = beta_func(alpha, beta, best_score)
+            if beta <= alpha:
+                if hooks is not None:
+                    hooks.cutoff(state, ply, cell)
+                if ply and search.ordering and remaining is not PROVEN:
+                    killers = search.killers[ply]
+                    if killers[0] != cell:
+                        killers[1] = killers[0]
+                        killers[0] = cell
+                    search.history[0 if current_player == X else 1][cell] += remaining * remaining
+                break  # Alpha-beta pruning
 
-        rival_node = play_player(board_result, sub_node, alpha, beta)
+    if best_score <= alpha_origin:
+        flag = UPPER
+    elif best_score >= beta_origin:
+        flag = LOWER
+    else:
+        flag = EXACT
+    search.table.save(key, symmetry, relative_score(best_score, ply), remaining, flag, best_cell)
 
-        sub_node.set_result(rival_node.result)
+    if node is not None:
+        tree.scores[node] = best_score
+    return best_score
 
-        if (current_best.result is None or check_better(rival_node, current_best)
-            or (rival_node.result == current_best.result and rival_node.get_selected_depth < current_best.get_selected_depth)
-        ):
-            current_best.set_selected(None, None)
-            sub_node.set_selected(1, rival_node.get_selected_depth)
-            current_best = sub_node
-            alpha, beta = beta_func(alpha, beta, current_best.result)
-            if beta <= alpha:
-                break  # Alpha-beta pruning
+# Seconds of search per move on boards too big to solve while a player waits
+MOVE_TIME = 1.0
 
-    return current_best
+
+def default_time_limit(size):
+    """
+    Returns the time_limit to search a board of this size with: None (an
+    exact search) up to 4x4, MOVE_TIME seconds past that.
+    """
+    return None if size <= 4 else MOVE_TIME
 
 def empty_board(board):
     """Verify if the board is completely empty"""
-    for rows in board:
-        for cell in rows:
-            if cell != EMPTY:
-                return False
+    state = game_state(board)
+    return not (state.x | state.o)
 
-    return True
-
-def minimax(board):
+def minimax(board, record_tree=False, table=None, time_limit=None, max_nodes=None, info=None,
+            ordering=True, stop=None, hooks=None, engine="alphabeta", iterations=None,
+            processes=None, seed=None, mcts_tree=None):
     """
     Returns the optimal action for the current player on the board.
-    """
-    current_player = player(board)
 
-    if terminal(board):
-        return None
+    With record_tree=True, returns (action, tree) where tree is the
+    SearchTree of the positions the search expanded, rooted at index 0.
+    With a solution table (see solutions.py) the action is read from it
+    instead of searched, unless a tree is being recorded. A table with a
+    store method (see book.py) is also given every search that finishes.
+
+    With a time_limit (seconds) or max_nodes budget the search deepens one
+    ply at a time, scoring the horizon heuristically, and returns the best
+    action of the deepest iteration it finished once the budget runs out.
+    Pass a SearchInfo as info to learn the depth reached and nodes searched.
+    ordering=False searches moves in board order, to measure what move
+    ordering saves; the chosen action is the same either way.
+    stop is an optional threading.Event: once it is set the search ends as
+    if its budget had run out.
+    hooks is a SearchHooks (such as SearchStats) called as the search runs.
+
+    processes > 1 splits the root moves over that many processes (see
+    parallel.py); the action is the same as a search in one process.
+    engine="mcts" picks the move by Monte Carlo tree search instead (see
+    mcts.py), limited by iterations and/or time_limit; processes > 1
+    searches the root in that many processes. seed seeds its playouts, and
+    mcts_tree is an mcts.MCTS to grow instead of the one kept per geometry.
+    """
+    if engine not in ("alphabeta", "mcts"):
+        raise ValueError(f"Unknown engine: {engine}")
+    if engine == "mcts" and record_tree:
+        raise ValueError("Only the alphabeta engine records a search tree")
+    if engine != "mcts" and (seed is not None or mcts_tree is not None):
+        raise ValueError("Only the mcts engine takes a seed or an MCTS tree")
+    split = engine == "alphabeta" and processes is not None and processes > 1
+    if split and (record_tree or max_nodes is not None or stop is not None or hooks is not None):
+        raise ValueError("A search split over processes takes no tree, max_nodes, stop or hooks")
+    # The search plays moves on its state, so it works on a copy
+    state = game_state(board).copy()
+
+    if state.terminal():
+        return (None, None) if record_tree else None
+
+    if table is not None and not record_tree:
+        solved = table.lookup(state)
+        if solved is not None:
+            if info is not None:
+                info.move = solved[1]
+                info.value = solved[0]
+                info.completed = solved[0] is not None
+                if info.completed:
+                    # Nothing was searched; the table knows the way to the end
+                    info.depth = 0
+                    info.distance = solved[2]
+                else:
+                    # A book move its search left unresolved, and how deep it went
+                    info.depth = solved[2]
+            return solved[1]
+
+    if engine == "mcts":
+        import mcts
+        cell = mcts.choose(state, iterations, time_limit, processes, info, stop, seed,
+                           mcts_tree)
+        return divmod(cell, state.geometry.size)
+
+    tree = None
+    root = None
+    if record_tree:
+        tree = SearchTree(state.geometry)
+        root = tree.add(state.packed())
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    search = Search(state, tree, max_nodes, deadline, ordering, info, stop, hooks)
+    root_player = max_player if state.turn == X else min_player
+    empties = state.geometry.cells - state.count
+
+    if time_limit is None and max_nodes is None:
+        depths = [PROVEN]
     else:
-        optimal_move = None
-        if current_player == X:
-            root = Node(current_player, current_player=X, action=None, board_result=None, result=-math.inf, selected=None, parent=None)
-            optimal_move = max_player(board, root, -math.inf, math.inf)
-        else:
-            root = Node(current_player, current_player=O, action=None, board_result=None, result=math.inf, selected=None, parent=None)
-            optimal_move = min_player(board, root, -math.inf, math.inf)
-        return optimal_move.get_custom_property("action")
+        depths = range(1, empties + 1)
+
+    best_cell = None
+    score = None
+    reached = 0
+    for depth in depths:
+        search.depth_limit = depth
+        search.best_cell = None
+        started = time.perf_counter() if hooks is not None else None
+        try:
+            if split:
+                import parallel
+                score = parallel.iteration(state, search, processes)
+            else:
+                score = root_player(state, root, -math.inf, math.inf, search)
+        except SearchBudgetExhausted:
+            if hooks is not None:
+                hooks.iteration(depth, None, time.perf_counter() - started, False)
+            if best_cell is None:
+                # Not even one ply finished: use what the first one had found
+                best_cell = search.best_cell
+            break
+        best_cell = search.best_cell
+        reached = min(depth, empties)
+        if hooks is not None:
+            hooks.iteration(depth, score, time.perf_counter() - started, True)
+        if info is not None:
+            info.depth = reached
+            info.move = divmod(best_cell, state.geometry.size)
+        if abs(score) >= 1:
+            # A forced result does not change with a deeper search
+            break
+
+    if best_cell is None:
+        best_cell = min(i * state.geometry.size + j for i, j in state.actions())
+    optimal_move = divmod(best_cell, state.geometry.size)
+    completed = reached == empties or (score is not None and abs(score) >= 1)
+
+    if completed:
+        value, distance = score_result(score, 0, state.count, state.geometry)
+        store = getattr(table, "store", None)
+        if store is not None and not record_tree:
+            store(state, value, optimal_move, distance)
+
+    if info is not None:
+        info.move = optimal_move
+        info.nodes = search.nodes
+        info.depth = reached
+        info.completed = completed
+        if score is not None:
+            info.score = score
+        if completed:
+            # A heuristic score says nothing about how the game ends
+            info.value = value
+            info.distance = distance
+    return (optimal_move, tree) if record_tree else optimal_move
+
+def _child_scores(state):
+    """Exact score of every empty cell's move, indexed by cell (None if occupied)"""
+    search = Search(state)
+    reply = min_player if state.turn == X else max_player
+    occupied = state.x | state.o
+    scores = [None] * state.geometry.cells
+    for cell in range(state.geometry.cells):
+        if occupied >> cell & 1:
+            continue
+        state.push(cell)
+        scores[cell] = reply(state, None, -math.inf, math.inf, search)
+        state.pop(cell)
+    return scores
+
+def solve_many(boards):
+    """
+    Yields (action, value) for every board of an iterable, in order: the
+    action minimax would play (None on finished games) and the value of the
+    board, 1 if X wins, -1 if O wins and 0 for a draw.
+
+    Boards that are the same position up to rotation or reflection are only
+    searched once, and every search shares the transposition tables, so
+    repeated and symmetric positions cost a lookup. Boards are consumed
+    lazily, so the input can be a stream.
+    """
+    solved = {}
+    for board in boards:
+        state = game_state(board).copy()
+        if state.terminal():
+            yield None, state.utility()
+            continue
+
+        geometry = state.geometry
+        key, symmetry = geometry.canonical_key(state.x, state.o)
+        scores = solved.get((geometry, key))
+        if scores is None:
+            # Keep the scores in canonical orientation so every symmetric
+            # board can read them
+            scores = [None] * geometry.cells
+            for cell, score in enumerate(_child_scores(state)):
+                if score is not None:
+                    scores[geometry.symmetries[symmetry][cell]] = score
+            solved[(geometry, key)] = scores
+
+        # Same choice as minimax: the first strictly better in actions() order
+        sign = 1 if state.turn == X else -1
+        permutation = geometry.symmetries[symmetry]
+        best_action = best_score = None
+        for i, j in state.actions():
+            score = sign * scores[permutation[i * geometry.size + j]]
+            if best_score is None or score > best_score:
+                best_action, best_score = (i, j), score
+        yield best_action, score_result(sign * best_score, 0, state.count, geometry)[0]
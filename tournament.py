@@ -0,0 +1,178 @@
+"""
+Headless self-play: engine configurations play each other across a process pool.
+
+A player is named by a spec:
+
+    minimax          the exact search (or a time/node budget on big boards)
+    nodes:N          minimax limited to N nodes per move
+    mcts:N           Monte Carlo tree search with N iterations per move, on a
+                     tree of its own seeded from the game
+    noisy:P          minimax, but a random move with probability P
+    random           a random legal move
+
+Every ordered pairing plays the same number of games, so each player gets
+both colours. Games are seeded from --seed and their index, so a run can
+be repeated exactly. One JSON record per game is streamed to --out.
+
+    python tournament.py minimax random noisy:0.2 --games 200 --out games.jsonl
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import mcts
+import solutions
+import tictactoe as ttt
+
+
+def make_player(spec, time_limit=None):
+    """Returns a function (board, rng) -> action for a player spec"""
+    name, _, argument = spec.partition(":")
+
+    if name == "random":
+        def choose(board, rng):
+            return rng.choice(sorted(ttt.actions(board)))
+    elif name == "minimax":
+        def choose(board, rng):
+            return ttt.minimax(board, table=solutions.process_table, time_limit=time_limit)
+    elif name == "nodes":
+        max_nodes = int(argument)
+
+        def choose(board, rng):
+            return ttt.minimax(board, max_nodes=max_nodes)
+    elif name == "mcts":
+        iterations = int(argument)
+        tree = None
+
+        def choose(board, rng):
+            nonlocal tree
+            if tree is None:
+                tree = mcts.MCTS(board.geometry, rng.getrandbits(32))
+            return ttt.minimax(board, engine="mcts", iterations=iterations, mcts_tree=tree)
+    elif name == "noisy":
+        noise = float(argument)
+
+        def choose(board, rng):
+            if rng.random() < noise:
+                return rng.choice(sorted(ttt.actions(board)))
+            return ttt.minimax(board, table=solutions.process_table, time_limit=time_limit)
+    else:
+        raise ValueError(f"Unknown player: {spec}")
+    return choose
+
+
+def play_game(task):
+    """Plays one game and returns its record"""
+    index, x_spec, o_spec, size, k, seed = task
+    rng = random.Random(f"{seed}:{index}")
+    time_limit = ttt.default_time_limit(size)
+    players = {
+        ttt.X: make_player(x_spec, time_limit),
+        ttt.O: make_player(o_spec, time_limit),
+    }
+
+    started = time.perf_counter()
+    board = ttt.initial_state(size, k)
+    moves = []
+    while not ttt.terminal(board):
+        action = players[ttt.player(board)](board, rng)
+        moves.append(list(action))
+        board = ttt.result(board, action)
+
+    return {
+        "game": index,
+        "size": size,
+        "k": board.geometry.k,
+        "x": x_spec,
+        "o": o_spec,
+        "winner": ttt.winner(board),
+        "moves": moves,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def pairings(players, games):
+    """Every ordered pair of distinct players (or self-play for one), games times each"""
+    pairs = list(itertools.permutations(players, 2)) or [(players[0], players[0])]
+    for _round in range(games):
+        for x_spec, o_spec in pairs:
+            yield x_spec, o_spec
+
+
+def tournament(players, games=10, processes=None, size=3, k=None, seed=0, table=None):
+    """
+    Yields one record per game as the games finish, in no particular order.
+    processes=1 plays in this process, without a pool.
+    """
+    for spec in players:
+        make_player(spec)
+    tasks = (
+        (index, x_spec, o_spec, size, k, seed)
+        for index, (x_spec, o_spec) in enumerate(pairings(players, games))
+    )
+
+    if processes == 1:
+        solutions.open_process_table(table)
+        yield from map(play_game, tasks)
+        return
+
+    processes = processes or os.cpu_count()
+    total = games * max(len(players) * (len(players) - 1), 1)
+    chunksize = max(1, total // (processes * 8))
+    with multiprocessing.Pool(processes, solutions.open_process_table, (table,)) as pool:
+        yield from pool.imap_unordered(play_game, tasks, chunksize)
+
+
+def summarize(records):
+    """Returns {(x, o): [x wins, draws, o wins]}"""
+    scores = {}
+    for record in records:
+        score = scores.setdefault((record["x"], record["o"]), [0, 0, 0])
+        if record["winner"] == ttt.X:
+            score[0] += 1
+        elif record["winner"] is None:
+            score[1] += 1
+        else:
+            score[2] += 1
+    return scores
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play engine configurations against each other.")
+    parser.add_argument("players", nargs="+", help="minimax, nodes:N, mcts:N, noisy:P or random")
+    parser.add_argument("--games", type=int, default=10, help="games per ordered pairing")
+    parser.add_argument("--processes", type=int, default=None, help="default: one per core")
+    parser.add_argument("--size", type=int, default=3)
+    parser.add_argument("--k", type=int, default=None, help="marks in a row needed to win")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write one JSON record per game to this file")
+    options = parser.parse_args()
+
+    table = None
+    if options.size == 3 and options.k in (None, 3) and os.path.exists(solutions.DEFAULT_PATH):
+        table = solutions.DEFAULT_PATH
+
+    out = open(options.out, "w") if options.out else None
+    records = []
+    started = time.perf_counter()
+    try:
+        for record in tournament(options.players, options.games, options.processes,
+                                 options.size, options.k, options.seed, table):
+            records.append(record)
+            if out is not None:
+                out.write(json.dumps(record) + "\n")
+    finally:
+        if out is not None:
+            out.close()
+    elapsed = time.perf_counter() - started
+
+    for (x_spec, o_spec), (x_wins, draws, o_wins) in sorted(summarize(records).items()):
+        print(f"{x_spec:>12} vs {o_spec:<12} X {x_wins:>5}  draw {draws:>5}  O {o_wins:>5}")
+    print(f"{len(records)} games in {elapsed:.2f}s, {len(records) / elapsed:.1f} games/sec",
+          file=sys.stderr)
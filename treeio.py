@@ -0,0 +1,275 @@
+"""
+Streaming export of recorded search trees, and a lazy reader for them.
+
+A SearchTree from minimax(board, record_tree=True) is written depth-first,
+one record per node, optionally cut off below a depth or after a number of
+nodes. Each record holds the size of its exported subtree, so a reader can
+step from a node to its next sibling without reading what lies between.
+
+Two formats share the same records:
+
+    JSONL   a header line, then one JSON object per node
+    binary  a fixed header, then fixed-size records (boards up to 5x5)
+
+TreeReader opens either one; the binary format is memory-mapped, and a
+JSONL file is indexed by line offsets only. Nodes are read as they are
+asked for, and to_node() builds Node objects for the part a visualizer
+shows.
+"""
+
+import json
+import mmap
+import struct
+from array import array
+
+import tictactoe as ttt
+
+MAGIC = b"TTTR"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBQ")
+# packed board, score, cell played (-1 at the root), depth, flags, subtree size
+RECORD = struct.Struct("<QdbBBI")
+
+SELECTED = 1
+TRUNCATED = 2
+
+
+def walk(tree, index=0, max_depth=None, max_nodes=None):
+    """
+    Yields (index, depth, truncated) for the nodes under index in
+    depth-first order. depth counts from index; truncated is True when the
+    node has children that max_depth or max_nodes leaves out.
+    """
+    stack = [(index, 0)]
+    # Which nodes max_nodes cuts short is only known once it stops the
+    # walk, so with a node limit the walk is held until then
+    held = None if max_nodes is None else []
+    while stack and (max_nodes is None or len(held) < max_nodes):
+        index, depth = stack.pop()
+        children = tree.children(index)
+        truncated = bool(children) and max_depth is not None and depth >= max_depth
+        if held is None:
+            yield index, depth, truncated
+        else:
+            held.append((index, depth, truncated))
+        if not truncated:
+            stack.extend((child, depth + 1) for child in reversed(children))
+    if held is not None:
+        # The parents of the nodes left on the stack lost those children
+        cut = {tree.parents[child] for child, _depth in stack}
+        for index, depth, truncated in held:
+            yield index, depth, truncated or index in cut
+
+
+def _subtree_sizes(depths):
+    """Subtree sizes of nodes listed depth-first, given their depths"""
+    sizes = array("I", bytes(4 * len(depths)))
+    open_nodes = []
+    for position, depth in enumerate(depths):
+        while open_nodes and depths[open_nodes[-1]] >= depth:
+            start = open_nodes.pop()
+            sizes[start] = position - start
+        open_nodes.append(position)
+    for start in open_nodes:
+        sizes[start] = len(depths) - start
+    return sizes
+
+
+def records(tree, format="jsonl", index=0, max_depth=None, max_nodes=None):
+    """
+    Yields the export of the subtree under index as chunks of bytes: the
+    header, then one record per node.
+    """
+    if format not in ("jsonl", "binary"):
+        raise ValueError(f"Unknown format: {format}")
+    geometry = tree.geometry
+    if format == "binary" and 2 * geometry.cells > 64:
+        raise ValueError("The binary format holds boards up to 5x5; use jsonl")
+
+    # Sizes must be known before a node is written, so the walk runs twice;
+    # the first pass keeps only the depth of each node
+    depths = array("i")
+    for _node, depth, _truncated in walk(tree, index, max_depth, max_nodes):
+        depths.append(depth)
+    sizes = _subtree_sizes(depths)
+    base = tree.depth(index)
+
+    if format == "binary":
+        yield HEADER.pack(MAGIC, VERSION, geometry.size, geometry.k, len(depths))
+    else:
+        header = {"format": "tictactoe-tree", "version": VERSION, "size": geometry.size,
+                  "k": geometry.k, "count": len(depths)}
+        yield (json.dumps(header) + "\n").encode()
+
+    for position, (node, _depth, truncated) in enumerate(
+            walk(tree, index, max_depth, max_nodes)):
+        parent = tree.parents[node]
+        flags = ((SELECTED if parent >= 0 and tree.selected[parent] == node else 0)
+                 | (TRUNCATED if truncated else 0))
+        if format == "binary":
+            yield RECORD.pack(tree.boards[node], tree.scores[node], tree.cells[node],
+                              base + depths[position], flags, sizes[position])
+        else:
+            yield (json.dumps({
+                "board": tree.boards[node],
+                "score": tree.scores[node],
+                "cell": tree.cells[node],
+                "depth": base + depths[position],
+                "flags": flags,
+                "size": sizes[position],
+            }) + "\n").encode()
+
+
+def export(tree, path, format=None, index=0, max_depth=None, max_nodes=None):
+    """
+    Writes the subtree under index to path and returns the number of nodes
+    written. The format defaults to jsonl for .jsonl files, else binary.
+    """
+    if format is None:
+        format = "jsonl" if path.endswith(".jsonl") else "binary"
+    count = 0
+    with open(path, "wb") as handle:
+        for chunk in records(tree, format, index, max_depth, max_nodes):
+            handle.write(chunk)
+            count += 1
+    return count - 1
+
+
+class ExportedNode:
+    """One node read back from an export; position is its place in the file"""
+    __slots__ = ("position", "board", "score", "cell", "depth", "flags", "size")
+
+    def __init__(self, position, board, score, cell, depth, flags, size):
+        self.position = position
+        self.board = board
+        self.score = score
+        self.cell = cell
+        self.depth = depth
+        self.flags = flags
+        self.size = size
+
+    @property
+    def selected(self):
+        return bool(self.flags & SELECTED)
+
+    @property
+    def truncated(self):
+        """Whether the node had children that were left out of the export"""
+        return bool(self.flags & TRUNCATED)
+
+    def __repr__(self):
+        return (f"ExportedNode(position={self.position}, cell={self.cell}, "
+                f"depth={self.depth}, score={self.score}, size={self.size})")
+
+
+class TreeReader:
+    """Reads the nodes of an exported tree as they are asked for"""
+
+    def __init__(self, path):
+        self._handle = open(path, "rb")
+        self._map = None
+        self._offsets = None
+        if self._handle.read(len(MAGIC)) == MAGIC:
+            self._map = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, size, k, self.count = HEADER.unpack_from(self._map, 0)
+            if version != VERSION:
+                self.close()
+                raise ValueError(f"{path} is a version {version} tree export")
+        else:
+            self._handle.seek(0)
+            header = json.loads(self._handle.readline())
+            if header.get("format") != "tictactoe-tree" or header.get("version") != VERSION:
+                self.close()
+                raise ValueError(f"{path} is not a tree export")
+            size, k, self.count = header["size"], header["k"], header["count"]
+            # Only where each line starts is kept, not the lines
+            self._offsets = array("q")
+            offset = self._handle.tell()
+            for line in self._handle:
+                self._offsets.append(offset)
+                offset += len(line)
+        self.geometry = ttt.get_geometry(size, k)
+
+    def __len__(self):
+        return self.count
+
+    def node(self, position):
+        """Returns the node at a position in the file"""
+        if not 0 <= position < self.count:
+            raise IndexError(position)
+        if self._map is not None:
+            fields = RECORD.unpack_from(self._map, HEADER.size + position * RECORD.size)
+            return ExportedNode(position, *fields)
+        self._handle.seek(self._offsets[position])
+        record = json.loads(self._handle.readline())
+        return ExportedNode(position, record["board"], record["score"], record["cell"],
+                            record["depth"], record["flags"], record["size"])
+
+    def root(self):
+        return self.node(0)
+
+    def children(self, node):
+        """Yields the exported children of a node, skipping over their subtrees"""
+        position = node.position + 1
+        end = node.position + node.size
+        while position < end:
+            child = self.node(position)
+            yield child
+            position += child.size
+
+    def subtree(self, node=None, max_depth=None):
+        """Yields the nodes under node depth-first, down to max_depth levels below it"""
+        if node is None:
+            node = self.root()
+        position = node.position
+        end = node.position + node.size
+        while position < end:
+            current = self.node(position)
+            yield current
+            if max_depth is not None and current.depth - node.depth >= max_depth:
+                position += current.size
+            else:
+                position += 1
+
+    def __iter__(self):
+        return self.subtree()
+
+    def state(self, node):
+        geometry = self.geometry
+        return ttt.GameState(node.board & geometry.full_mask, node.board >> geometry.cells,
+                             geometry=geometry)
+
+    def to_node(self, node=None, max_depth=None, parent=None, name=None):
+        """
+        Builds Node objects for the subtree under node, down to max_depth
+        levels, with the fields SearchTree.to_node gives them.
+        """
+        if node is None:
+            node = self.root()
+        state = self.state(node)
+        value, selected_depth = ttt.score_result(node.score, node.depth, state.count,
+                                                 self.geometry)
+        current_player = ttt.O if state.turn == ttt.X else ttt.X
+        if name is None:
+            name = current_player = state.turn
+        action = None if node.cell < 0 else divmod(node.cell, self.geometry.size)
+        result_node = ttt.Node(name, current_player=current_player, action=action,
+                               board_result=state.to_board(), result=value, score=node.score,
+                               selected=1 if node.selected else None, parent=parent)
+        result_node.set_selected_depth_value(selected_depth)
+        if max_depth is None or max_depth > 0:
+            for i, child in enumerate(self.children(node)):
+                self.to_node(child, None if max_depth is None else max_depth - 1,
+                             result_node, str(i) + state.turn)
+        return result_node
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
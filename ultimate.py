@@ -0,0 +1,386 @@
+"""
+Ultimate tic-tac-toe: nine 3x3 boards laid out as a 3x3 meta-board.
+
+Winning a small board claims its square on the meta-board, and three
+claimed squares in a row win the game. The cell a move is played on sends
+the opponent to the small board in the same place; when that board is
+already decided they may play on any open board.
+
+The state is packed into bitboards: x and o hold one bit per cell, board
+b taking bits 9 * b to 9 * b + 8, so each small board reads as a 3x3
+GameState mask and wins are found with the 3x3 geometry's lines. Moves
+are cell indices in that layout; actions are (row, column) on the 9x9 grid.
+
+With some 81 plies of about 9 moves each the game cannot be searched to
+the end, so choose() runs alpha-beta to increasing depths until its time
+budget (by default under 100 ms) runs out, scoring the horizon by who is
+ahead on the meta-board and on the open small boards.
+
+    python ultimate.py [--games N] [--time SECONDS]
+"""
+
+import argparse
+import math
+import time
+
+import tictactoe as ttt
+
+GEOMETRY = ttt.DEFAULT_GEOMETRY
+BOARDS = 9
+CELLS = BOARDS * GEOMETRY.cells
+SMALL = GEOMETRY.full_mask
+# Seconds per move of choose(), leaving room under 100 ms
+MOVE_TIME = 0.08
+# Larger than any heuristic score, less the plies to the win
+WIN_SCORE = 1000
+
+# (row, column) on the 9x9 grid of each move, and back
+GRID = tuple(((move // 27) * 3 + move % 9 // 3, (move // 9) % 3 * 3 + move % 3)
+             for move in range(CELLS))
+MOVES = {action: move for move, action in enumerate(GRID)}
+# Cells of the open boards for each mask of decided boards
+_OPEN_CELLS = tuple(
+    sum(SMALL << 9 * board for board in range(BOARDS) if not decided >> board & 1)
+    for decided in range(1 << BOARDS))
+# How many meta-board lines go through each board: center 4, corners 3, edges 2
+_BOARD_WEIGHTS = tuple(len(GEOMETRY.cell_lines[board]) for board in range(BOARDS))
+_SMALL_SCALE = 2 * sum(_BOARD_WEIGHTS) + 1
+
+
+class UltimateState:
+    """
+    Bitboard state of an ultimate game. x_boards, o_boards and drawn are
+    9-bit masks of the small boards won by each side or filled without a
+    winner; target is the board the side to move must play on, or -1.
+    """
+    __slots__ = ("x", "o", "turn", "count", "target", "x_boards", "o_boards", "drawn", "won",
+                 "_undo")
+
+    def __init__(self):
+        self.x = 0
+        self.o = 0
+        self.turn = ttt.X
+        self.count = 0
+        self.target = -1
+        self.x_boards = 0
+        self.o_boards = 0
+        self.drawn = 0
+        self.won = None
+        self._undo = []
+
+    def copy(self):
+        state = UltimateState.__new__(UltimateState)
+        state.x = self.x
+        state.o = self.o
+        state.turn = self.turn
+        state.count = self.count
+        state.target = self.target
+        state.x_boards = self.x_boards
+        state.o_boards = self.o_boards
+        state.drawn = self.drawn
+        state.won = self.won
+        state._undo = []
+        return state
+
+    @classmethod
+    def from_moves(cls, actions):
+        """The state after playing a list of (row, column) actions from the start"""
+        state = cls()
+        for action in actions:
+            move = MOVES.get(action)
+            if move is None or not state.legal() >> move & 1:
+                raise ValueError(f"Illegal move: {action}")
+            state.push(move)
+        return state
+
+    def decided(self):
+        """Mask of the small boards that are won or full"""
+        return self.x_boards | self.o_boards | self.drawn
+
+    def legal(self):
+        """Bitmask of the moves the side to move may play"""
+        if self.won is not None:
+            return 0
+        free = ~(self.x | self.o)
+        target = self.target
+        if target >= 0:
+            return free & SMALL << 9 * target
+        return free & _OPEN_CELLS[self.decided()]
+
+    def moves(self):
+        """The legal moves as cell indices, in increasing order"""
+        legal = self.legal()
+        moves = []
+        while legal:
+            bit = legal & -legal
+            moves.append(bit.bit_length() - 1)
+            legal ^= bit
+        return moves
+
+    def actions(self):
+        """Set of (row, column) on the 9x9 grid for every legal move"""
+        return {GRID[move] for move in self.moves()}
+
+    def terminal(self):
+        return self.won is not None or not self.legal()
+
+    def utility(self):
+        return 1 if self.won == ttt.X else -1 if self.won == ttt.O else 0
+
+    def push(self, move):
+        """Play the side to move on a legal move, in place"""
+        self._undo.append((self.target, self.x_boards, self.o_boards, self.drawn))
+        board, cell = divmod(move, 9)
+        shift = 9 * board
+        if self.turn == ttt.X:
+            self.x |= 1 << move
+            mine = self.x >> shift & SMALL
+            self.turn = ttt.O
+        else:
+            self.o |= 1 << move
+            mine = self.o >> shift & SMALL
+            self.turn = ttt.X
+        self.count += 1
+
+        for mask in GEOMETRY.cell_lines[cell]:
+            if mine & mask == mask:
+                # The small board is won: claim its square on the meta-board
+                if self.turn == ttt.O:
+                    self.x_boards |= 1 << board
+                    claimed = self.x_boards
+                else:
+                    self.o_boards |= 1 << board
+                    claimed = self.o_boards
+                for line in GEOMETRY.cell_lines[board]:
+                    if claimed & line == line:
+                        self.won = ttt.O if self.turn == ttt.X else ttt.X
+                        break
+                break
+        else:
+            if (self.x | self.o) >> shift & SMALL == SMALL:
+                self.drawn |= 1 << board
+        self.target = -1 if self.decided() >> cell & 1 else cell
+
+    def pop(self, move):
+        """Take back the last move, which was played on move"""
+        self.target, self.x_boards, self.o_boards, self.drawn = self._undo.pop()
+        if self.turn == ttt.X:
+            self.o ^= 1 << move
+            self.turn = ttt.O
+        else:
+            self.x ^= 1 << move
+            self.turn = ttt.X
+        self.count -= 1
+        self.won = None
+
+    def packed(self):
+        """Both masks and the target in one integer, a key for the position"""
+        return self.x | self.o << CELLS | (self.target + 1) << 2 * CELLS
+
+    def small_board(self, board):
+        """The GameState of one small board"""
+        shift = 9 * board
+        return ttt.GameState(self.x >> shift & SMALL, self.o >> shift & SMALL)
+
+    def to_board(self):
+        """The 9x9 grid as rows of X, O and EMPTY"""
+        rows = [[ttt.EMPTY] * 9 for _ in range(9)]
+        for move, (i, j) in enumerate(GRID):
+            if self.x >> move & 1:
+                rows[i][j] = ttt.X
+            elif self.o >> move & 1:
+                rows[i][j] = ttt.O
+        return rows
+
+    def __repr__(self):
+        return (f"UltimateState(count={self.count}, turn={self.turn!r}, target={self.target}, "
+                f"won={self.won!r})")
+
+
+def initial_state():
+    return UltimateState()
+
+
+def result(state, action):
+    """Returns the state after playing (row, column), leaving state as it was"""
+    move = MOVES.get(action)
+    if move is None or not state.legal() >> move & 1:
+        raise ValueError("The action is not valid")
+    new_state = state.copy()
+    new_state.push(move)
+    return new_state
+
+
+_small_scores = {}
+
+
+def evaluate(state):
+    """
+    Heuristic score from X's side, strictly between -1 and 1: the meta-board
+    weighs most, then the open small boards, more so the more meta-board
+    lines run through them.
+    """
+    # A drawn board blocks every meta-board line through it, for both sides
+    drawn = state.drawn
+    score = GEOMETRY.evaluate(state.x_boards | drawn, state.o_boards | drawn)
+    decided = state.decided()
+    x, o = state.x, state.o
+    small = 0.0
+    for board in range(BOARDS):
+        if not decided >> board & 1:
+            key = (x >> 9 * board & SMALL) | (o >> 9 * board & SMALL) << 9
+            value = _small_scores.get(key)
+            if value is None:
+                value = _small_scores[key] = GEOMETRY.evaluate(key & SMALL, key >> 9)
+            small += _BOARD_WEIGHTS[board] * value
+    return score + small / _SMALL_SCALE
+
+
+class _Search:
+    __slots__ = ("nodes", "max_nodes", "deadline", "stop", "table")
+
+    def __init__(self, max_nodes, deadline, stop):
+        self.nodes = 0
+        self.max_nodes = math.inf if max_nodes is None else max_nodes
+        self.deadline = math.inf if deadline is None else deadline
+        self.stop = stop
+        # packed position -> (depth, score, flag, best move)
+        self.table = {}
+
+    def count_node(self):
+        self.nodes += 1
+        if self.nodes >= self.max_nodes:
+            raise ttt.SearchBudgetExhausted()
+        if not self.nodes & 63 and (time.perf_counter() >= self.deadline
+                                    or (self.stop is not None and self.stop.is_set())):
+            raise ttt.SearchBudgetExhausted()
+
+
+def _ordered(state, moves, best):
+    """The best move of a shallower search first, then moves that win a small board"""
+    mine = state.x if state.turn == ttt.X else state.o
+    first = []
+    rest = []
+    for move in moves:
+        board, cell = divmod(move, 9)
+        small = (mine >> 9 * board & SMALL) | 1 << cell
+        if move == best or any(small & mask == mask for mask in GEOMETRY.cell_lines[cell]):
+            first.append(move)
+        else:
+            rest.append(move)
+    if best in first:
+        first.remove(best)
+        first.insert(0, best)
+    return first + rest
+
+
+def _negamax(state, depth, ply, alpha, beta, search):
+    """Score of state for the side to move, searched depth plies deep"""
+    search.count_node()
+    if state.won is not None:
+        # The side that just moved has won
+        return ply - WIN_SCORE
+    moves = state.moves()
+    if not moves:
+        return 0
+    if depth == 0:
+        score = evaluate(state)
+        return score if state.turn == ttt.X else -score
+
+    key = state.packed()
+    entry = search.table.get(key)
+    best = None
+    if entry is not None:
+        entry_depth, score, flag, best = entry
+        if entry_depth >= depth and (flag == ttt.EXACT or (flag == ttt.LOWER and score >= beta)
+                                     or (flag == ttt.UPPER and score <= alpha)):
+            return score
+
+    original_alpha = alpha
+    best_score = -math.inf
+    for move in _ordered(state, moves, best):
+        state.push(move)
+        score = -_negamax(state, depth - 1, ply + 1, -beta, -alpha, search)
+        state.pop(move)
+        if score > best_score:
+            best_score = score
+            best = move
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+
+    # Win scores depend on the ply they were found at, so only store heuristic ones
+    if abs(best_score) < 1:
+        flag = (ttt.UPPER if best_score <= original_alpha
+                else ttt.LOWER if best_score >= beta else ttt.EXACT)
+        search.table[key] = (depth, best_score, flag, best)
+    return best_score
+
+
+def choose(state, time_limit=MOVE_TIME, max_nodes=None, info=None, stop=None):
+    """
+    Returns the (row, column) to play on a non-terminal state. The search
+    deepens one ply at a time and answers with the best move of the
+    deepest iteration that finished within time_limit seconds and max_nodes
+    nodes; stop is an optional threading.Event that ends it early. Pass a
+    tictactoe.SearchInfo as info to learn the depth reached.
+    """
+    if state.terminal():
+        raise ValueError("The game is already over")
+    root = state.copy()
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    search = _Search(max_nodes, deadline, stop)
+    moves = root.moves()
+    best_move = moves[0]
+    best_score = None
+    reached = 0
+
+    for depth in range(1, CELLS - root.count + 1):
+        alpha = -math.inf
+        iteration_best = None
+        try:
+            for move in _ordered(root, moves, best_move):
+                root.push(move)
+                score = -_negamax(root, depth - 1, 1, -math.inf, -alpha, search)
+                root.pop(move)
+                if score > alpha:
+                    alpha = score
+                    iteration_best = move
+        except ttt.SearchBudgetExhausted:
+            break
+        best_move, best_score, reached = iteration_best, alpha, depth
+        if abs(best_score) >= 1:
+            # A forced result does not change with a deeper search
+            break
+
+    if info is not None:
+        info.move = GRID[best_move]
+        info.nodes = search.nodes
+        info.depth = reached
+        info.completed = best_score is not None and abs(best_score) >= 1
+        if best_score is not None:
+            info.score = best_score if root.turn == ttt.X else -best_score
+            info.value = (1 if info.score >= 1 else -1) if info.completed else None
+    return GRID[best_move]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Self-play games of ultimate tic-tac-toe.")
+    parser.add_argument("--games", type=int, default=1)
+    parser.add_argument("--time", type=float, default=MOVE_TIME, help="seconds per move")
+    options = parser.parse_args()
+
+    times = []
+    for _game in range(options.games):
+        state = initial_state()
+        while not state.terminal():
+            info = ttt.SearchInfo()
+            started = time.perf_counter()
+            action = choose(state, options.time, info=info)
+            times.append(time.perf_counter() - started)
+            state.push(MOVES[action])
+        print(f"{state.count} moves, winner {state.won}")
+    times.sort()
+    print(f"{len(times)} moves; ms per move: median {times[len(times) // 2] * 1000:.1f}, "
+          f"max {times[-1] * 1000:.1f}")
@@ -1,7 +1,38 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import pickle
+import random
+import tempfile
+import threading
+import time
 import unittest
 
 from tictactoe import initial_state, player, X, O, actions
 from tictactoe import EMPTY as _, result, winner, terminal, utility, minimax
+from tictactoe import GameState, board_match, game_state
+from tictactoe import TRANSPOSITION_TABLE, canonical_key, get_geometry
+from tictactoe import SearchInfo, solve_many, SearchHooks, SearchStats, Node
+from tictactoe import default_time_limit
+import tictactoe
+import solutions
+import benchmark
+import tournament
+import server
+import mcts
+import pools
+import treeio
+import records
+import book
+import ultimate
+import differential
+
+try:
+    import numpy
+    import vectorized
+except ImportError:
+    numpy = None
 
 
 class TestPlayer(unittest.TestCase):
@@ -137,6 +168,1051 @@ class TestUtility(unittest.TestCase):
         self.assertEqual(-1, utility(fake_board))
 
 
+class TestGameState(unittest.TestCase):
+    def test_round_trip(self):
+        board = [[X, O, _], [_, X, _], [_, _, _]]
+        state = GameState.from_board(board)
+        self.assertEqual(board, state.to_board())
+        self.assertEqual(O, state.turn)
+
+    def test_empty(self):
+        state = GameState.from_board(initial_state())
+        self.assertEqual(0, state.x | state.o)
+        self.assertEqual(X, state.turn)
+        self.assertEqual(9, len(state.actions()))
+
+    def test_push_pop_restores_state(self):
+        board = [[X, O, _], [O, X, _], [_, _, _]]
+        state = GameState.from_board(board)
+        state.push(8)
+        self.assertEqual(X, state.winner())
+        self.assertTrue(state.terminal())
+        self.assertEqual(5, state.count)
+        state.pop(8)
+        self.assertEqual(GameState.from_board(board), state)
+        self.assertIsNone(state.winner())
+        self.assertEqual(4, state.count)
+
+    def test_matches_board_functions(self):
+        boards = [
+            [[X, O, X], [O, X, O], [X, O, X]],
+            [[X, O, X], [O, O, X], [X, X, O]],
+            [[_]*3, [_]*3, [O]*3],
+            [[_, _, O], [_, O, _], [O, _, _]],
+            [[X, O, X], [_, O, _], [O, X, X]],
+        ]
+        for board in boards:
+            state = GameState.from_board(board)
+            self.assertEqual(winner(board), state.winner())
+            self.assertEqual(terminal(board), state.terminal())
+            self.assertEqual(utility(board), state.utility())
+            self.assertEqual(O if state.winner() == O else None, board_match(board, O))
+
+
+class TestTranspositionTable(unittest.TestCase):
+    def test_symmetric_positions_share_key(self):
+        corner = GameState.from_board([[X, _, _], [_, O, _], [_, _, _]])
+        rotated = GameState.from_board([[_, _, X], [_, O, _], [_, _, _]])
+        reflected = GameState.from_board([[_, _, _], [_, O, _], [X, _, _]])
+        key = canonical_key(corner.x, corner.o)[0]
+        self.assertEqual(key, canonical_key(rotated.x, rotated.o)[0])
+        self.assertEqual(key, canonical_key(reflected.x, reflected.o)[0])
+        edge = GameState.from_board([[_, X, _], [_, O, _], [_, _, _]])
+        self.assertNotEqual(key, canonical_key(edge.x, edge.o)[0])
+
+    def test_persists_across_calls(self):
+        TRANSPOSITION_TABLE.clear()
+        board = [[X, _, _], [_, _, _], [_, _, _]]
+        self.assertEqual((1, 1), minimax(board))
+        self.assertGreater(len(TRANSPOSITION_TABLE), 0)
+        hits = TRANSPOSITION_TABLE.hits
+        self.assertEqual((1, 1), minimax(board))
+        self.assertGreater(TRANSPOSITION_TABLE.hits, hits)
+
+    def test_best_move_in_board_orientation(self):
+        TRANSPOSITION_TABLE.clear()
+        board = [[X, X, _], [O, O, _], [_, _, _]]
+        self.assertEqual((0, 2), minimax(board))
+        # Rotated a quarter turn clockwise, never searched itself
+        rotated = [[_, O, X], [_, O, X], [_, _, _]]
+        self.assertEqual((2, 2), TRANSPOSITION_TABLE.best_move(GameState.from_board(rotated)))
+        mirrored = [[_, X, X], [_, O, O], [_, _, _]]
+        self.assertEqual((0, 0), TRANSPOSITION_TABLE.best_move(GameState.from_board(mirrored)))
+
+
+    def test_bounded_slots(self):
+        geometry = get_geometry(3)
+        table = tictactoe.TranspositionTable(geometry, slots=7)
+        # Keys 1, 8 and 15 share slot 1
+        table.save(1, 0, 0, 5, tictactoe.EXACT, None)
+        table.save(8, 0, 0, 2, tictactoe.EXACT, None)
+        table.save(15, 0, 0, 3, tictactoe.EXACT, None)
+        self.assertEqual(2, len(table))
+        # The deepest result stays, the latest other one replaces the rest
+        self.assertEqual(5, table.lookup(1).draft)
+        self.assertIsNone(table.lookup(8))
+        self.assertEqual(3, table.lookup(15).draft)
+        table.save(8, 0, 0, 6, tictactoe.EXACT, None)
+        self.assertEqual((6, 5), (table.lookup(8).draft, table.lookup(1).draft))
+        self.assertIsNone(table.lookup(15))
+
+    def test_search_with_few_slots(self):
+        geometry = get_geometry(4)
+        table = geometry.table
+        try:
+            geometry.table = tictactoe.TranspositionTable(geometry, slots=101)
+            board = [[X, O, X, _], [_, O, _, _], [_, X, _, _], [O, _, _, _]]
+            move = minimax(board)
+            self.assertLessEqual(len(geometry.table), 202)
+            table.clear()
+            geometry.table = table
+            self.assertEqual(minimax(board), move)
+        finally:
+            geometry.table = table
+
+class TestSearchTree(unittest.TestCase):
+    def test_not_recorded_by_default(self):
+        board = [[X, _, _], [_, _, _], [_, _, _]]
+        self.assertEqual((1, 1), minimax(board))
+
+    def test_record_tree(self):
+        TRANSPOSITION_TABLE.clear()
+        board = [[_, X, O], [_, O, _], [X, X, _]]
+        move, tree = minimax(board, record_tree=True)
+        self.assertEqual((2, 2), move)
+        self.assertEqual(4, len(tree.children(0)))
+        best = tree.selected[0]
+        self.assertEqual(move, tree.action(best))
+        self.assertEqual(0, tree.parents[best])
+        self.assertEqual(1, tree.depth(best))
+        self.assertEqual(result(board, move), tree.state(best).to_board())
+
+    def test_to_node(self):
+        TRANSPOSITION_TABLE.clear()
+        board = [[_, X, O], [O, X, X], [X, _, O]]
+        move, tree = minimax(board, record_tree=True)
+        root = tree.to_node()
+        self.assertEqual(O, root.name)
+        self.assertEqual(len(tree), 1 + sum(1 for _ in _walk(root)))
+        selected = [child for child in root.children if child.get_selected == 1]
+        self.assertEqual([move], [child.get_custom_property("action") for child in selected])
+
+    def test_large_board(self):
+        board = initial_state(12)
+        move, tree = minimax(board, record_tree=True, max_nodes=300)
+        self.assertEqual(move, divmod(tree.cells[tree.selected[0]], 12))
+        # Cells past 127 are kept as they are
+        self.assertEqual(143, max(tree.cells))
+
+    def test_terminal_board(self):
+        full_board = [[X, O, X], [O, X, O], [X, O, X]]
+        self.assertEqual((None, None), minimax(full_board, record_tree=True))
+
+
+def _walk(node):
+    for child in node.children:
+        yield child
+        yield from _walk(child)
+
+
+class TestSolutionTable(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        handle, cls.path = tempfile.mkstemp(suffix=".bin")
+        os.close(handle)
+        cls.solved = solutions.build_table(cls.path)
+        cls.table = solutions.SolutionTable(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.table.close()
+        os.remove(cls.path)
+
+    def test_every_reachable_position(self):
+        self.assertEqual(5478, self.solved)
+
+    def test_lookup(self):
+        self.assertEqual((0, (0, 1), 9), self.table.lookup(GameState()))
+        board = [[_, X, _], [_, _, O], [_, _, _]]
+        self.assertEqual((1, (1, 1), 5), self.table.lookup(GameState.from_board(board)))
+        full_board = [[X, O, X], [O, X, O], [X, O, X]]
+        self.assertEqual((1, None, 0), self.table.lookup(GameState.from_board(full_board)))
+
+    def test_unreachable(self):
+        self.assertIsNone(self.table.lookup(GameState.from_board([[X, X, X], [_]*3, [_]*3])))
+
+    def test_matches_search(self):
+        boards = [
+            [[_, X, O], [O, X, X], [X, _, O]],
+            [[X, X, O], [_, _, _], [O, _, _]],
+            [[_, X, O], [_, O, _], [X, X, _]],
+            [[_, _, _], [X, O, O], [_, X, _]],
+            initial_state(),
+        ]
+        for board in boards:
+            self.assertEqual(minimax(board), minimax(board, table=self.table))
+
+
+class TestGeometry(unittest.TestCase):
+    def test_line_tables(self):
+        self.assertEqual(8, len(get_geometry(3).win_masks))
+        self.assertEqual(10, len(get_geometry(4).win_masks))
+        self.assertEqual(28, len(get_geometry(5).win_masks))
+        self.assertEqual(48, len(get_geometry(5, 3).win_masks))
+
+    def test_shared_instances(self):
+        self.assertIs(get_geometry(4), get_geometry(4, 4))
+        self.assertIs(get_geometry(4), initial_state(4).geometry)
+        self.assertRaises(ValueError, get_geometry, 3, 4)
+
+    def test_larger_board(self):
+        board = initial_state(5)
+        self.assertEqual(25, len(actions(board)))
+        for action in [(0, 0), (4, 4), (1, 1), (4, 3), (2, 2)]:
+            board = result(board, action)
+        self.assertIs(get_geometry(5), board.geometry)
+        self.assertIsNone(winner(board))
+        board = result(board, (4, 2))
+        board = result(board, (3, 3))
+        self.assertEqual(X, winner(board))
+        self.assertTrue(terminal(board))
+
+    def test_result_bounds(self):
+        board = initial_state(4)
+        self.assertEqual(X, result(board, (3, 3))[3][3])
+        self.assertRaisesRegex(ValueError, "The action is not valid",
+                                result, board, (4, 0))
+
+    def test_plain_list_board(self):
+        board = [[_] * 4 for _ in range(4)]
+        board[0] = [X, X, X, _]
+        board[1] = [O, O, O, _]
+        self.assertIsNone(winner(board))
+        self.assertEqual((0, 3), minimax(board))
+
+    def test_four_by_four_block(self):
+        board = initial_state(4)
+        for action in [(0, 0), (3, 3), (0, 1), (2, 2), (0, 2)]:
+            board = result(board, action)
+        self.assertEqual((0, 3), minimax(board))
+
+
+class TestSearchBudget(unittest.TestCase):
+    def test_time_limit(self):
+        info = SearchInfo()
+        move = minimax(initial_state(5), time_limit=0.2, info=info)
+        self.assertIn(move, actions(initial_state(5)))
+        self.assertEqual(move, info.move)
+        self.assertGreaterEqual(info.depth, 1)
+        self.assertFalse(info.completed)
+        # An unresolved search does not claim a draw
+        self.assertIsNone(info.value)
+
+    def test_default_time_limit(self):
+        self.assertIsNone(default_time_limit(4))
+        self.assertEqual(tictactoe.MOVE_TIME, default_time_limit(5))
+
+    def test_node_limit(self):
+        info = SearchInfo()
+        move = minimax(initial_state(5), max_nodes=5, info=info)
+        self.assertIn(move, actions(initial_state(5)))
+        self.assertLessEqual(info.nodes, 5)
+
+    def test_enough_budget_solves(self):
+        board = [[_, X, _], [_, _, O], [_, _, _]]
+        info = SearchInfo()
+        self.assertEqual(minimax(board), minimax(board, time_limit=10, info=info))
+        self.assertTrue(info.completed)
+        self.assertEqual(1, info.value)
+
+    def test_forced_win_stops_deepening(self):
+        board = [[X, X, _], [O, O, _], [_, _, _]]
+        info = SearchInfo()
+        self.assertEqual((0, 2), minimax(board, max_nodes=1000, info=info))
+        self.assertEqual(1, info.depth)
+        self.assertTrue(info.completed)
+
+    def test_root_ordered_when_deepening(self):
+        board = initial_state(5)
+        table = board.geometry.table
+        table.clear()
+
+        class FirstMoves(SearchHooks):
+            def __init__(self):
+                self.best = None
+                self.pairs = []
+
+            def node(self, state, ply):
+                if ply == 1 and self.best is not None:
+                    move = divmod((state.x | state.o).bit_length() - 1, 5)
+                    self.pairs.append((self.best, move))
+                    self.best = None
+
+            def iteration(self, depth, score, seconds, completed):
+                self.best = table.best_move(game_state(board))
+
+        hooks = FirstMoves()
+        minimax(board, max_nodes=20000, hooks=hooks)
+        self.assertGreaterEqual(len(hooks.pairs), 2)
+        # Each iteration starts from the best move of the one before
+        for best, first in hooks.pairs:
+            self.assertEqual(best, first)
+
+    def test_stop_event(self):
+        stop = threading.Event()
+        stop.set()
+        info = SearchInfo()
+        move = minimax(initial_state(6), time_limit=60, info=info, stop=stop)
+        self.assertIn(move, actions(initial_state(6)))
+        self.assertLessEqual(info.nodes, 256)
+        self.assertFalse(info.completed)
+
+    def test_progress_from_another_thread(self):
+        stop = threading.Event()
+        info = SearchInfo()
+        worker = threading.Thread(
+            target=minimax, args=(initial_state(6),), kwargs=dict(time_limit=60, info=info, stop=stop))
+        worker.start()
+        while info.depth < 1:
+            time.sleep(0.01)
+        self.assertIsNotNone(info.move)
+        stop.set()
+        worker.join(5)
+        self.assertFalse(worker.is_alive())
+
+    def test_evaluation_favours_open_lines(self):
+        geometry = get_geometry(3)
+        center = GameState.from_board([[_, _, _], [_, X, _], [_, _, _]])
+        edge = GameState.from_board([[_, X, _], [_, _, _], [_, _, _]])
+        self.assertGreater(geometry.evaluate(center.x, center.o), geometry.evaluate(edge.x, edge.o))
+        self.assertLess(abs(geometry.evaluate(center.x, center.o)), 1)
+
+
+class TestMoveOrdering(unittest.TestCase):
+    positions = [
+        initial_state(),
+        [[X, _, _], [_, _, _], [_, _, _]],
+        [[_, X, _], [_, _, O], [_, _, _]],
+        [[X, _, O], [_, _, _], [_, _, _]],
+        [[_, _, _], [X, O, O], [_, X, _]],
+        initial_state(4),
+    ]
+
+    def nodes(self, board, ordering):
+        board_geometry = get_geometry(len(board))
+        board_geometry.table.clear()
+        info = SearchInfo()
+        move = minimax(board, info=info, ordering=ordering)
+        return move, info.nodes
+
+    def test_same_moves_fewer_nodes(self):
+        ordered_total = unordered_total = 0
+        for board in self.positions:
+            move, ordered = self.nodes(board, True)
+            unordered_move, unordered = self.nodes(board, False)
+            self.assertEqual(unordered_move, move)
+            ordered_total += ordered
+            unordered_total += unordered
+        self.assertLess(ordered_total, unordered_total)
+
+    def test_positional_order(self):
+        self.assertEqual((4, 0, 2, 6, 8, 1, 3, 5, 7), get_geometry(3).move_order)
+
+
+class TestSolveMany(unittest.TestCase):
+    def test_matches_minimax(self):
+        boards = [
+            initial_state(),
+            [[_, X, O], [O, X, X], [X, _, O]],
+            [[X, X, O], [_, _, _], [O, _, _]],
+            [[_, X, _], [_, _, O], [_, _, _]],
+            [[_, _, _], [X, O, O], [_, X, _]],
+            [[X, O, X], [O, X, O], [X, O, X]],
+        ]
+        solved = list(solve_many(iter(boards)))
+        self.assertEqual([minimax(board) for board in boards], [move for move, _ in solved])
+        self.assertEqual([0, 0, 1, 1, 1, 1], [value for _, value in solved])
+
+    def test_symmetric_boards(self):
+        # The same position in its 4 rotations, each solved as minimax would
+        boards = [
+            [[_, X, _], [_, _, O], [_, _, _]],
+            [[_, _, _], [_, _, X], [_, O, _]],
+            [[_, _, _], [O, _, _], [_, X, _]],
+            [[_, O, _], [X, _, _], [_, _, _]],
+        ]
+        for board, (move, value) in zip(boards, solve_many(boards)):
+            self.assertEqual(minimax(board), move)
+            self.assertEqual(1, value)
+
+    def test_lazy(self):
+        def stream():
+            yield initial_state()
+            raise AssertionError("read past the first board")
+        self.assertEqual(((0, 1), 0), next(solve_many(stream())))
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestVectorized(unittest.TestCase):
+    def setUp(self):
+        self.boards = [GameState(x, o).to_board()
+                       for level in solutions.reachable_levels() for x, o in level]
+        # Boards no game reaches, including both players owning a line
+        self.boards.append([[X, X, X], [O, O, O], [_, _, _]])
+        self.boards.append([[O, O, O], [_, _, _], [_, _, _]])
+
+    def expected(self):
+        codes = {X: 1, O: -1, None: 0}
+        return ([codes[winner(board)] for board in self.boards],
+                [terminal(board) for board in self.boards],
+                [utility(board) for board in self.boards])
+
+    def test_cell_arrays(self):
+        winners, terminals, utilities = self.expected()
+        array = vectorized.to_array(self.boards)
+        self.assertEqual(winners, vectorized.winner(array).tolist())
+        self.assertEqual(terminals, vectorized.terminal(array).tolist())
+        self.assertEqual(utilities, vectorized.utility(array).tolist())
+
+    def test_packed_boards(self):
+        winners, terminals, utilities = self.expected()
+        packed = numpy.array([GameState.from_board(board).packed() for board in self.boards])
+        winner_array, draws, values = vectorized.classify(packed)
+        self.assertEqual(winners, winner_array.tolist())
+        self.assertEqual(terminals, (draws | (winner_array != 0)).tolist())
+        self.assertEqual(utilities, values.tolist())
+
+    def test_larger_board(self):
+        board = initial_state(4)
+        for action in [(0, 0), (3, 3), (1, 1), (3, 2), (2, 2), (3, 1)]:
+            board = result(board, action)
+        boards = [board, result(board, (3, 0)), result(board, (0, 3))]
+        self.assertEqual([0, 0, 0], vectorized.winner(vectorized.to_array(boards)).tolist())
+        boards.append(result(result(board, (0, 3)), (3, 0)))
+        self.assertEqual([utility(board) for board in boards],
+                         vectorized.utility(vectorized.to_array(boards)).tolist())
+
+
+class TestSearchStats(unittest.TestCase):
+    def test_counts(self):
+        TRANSPOSITION_TABLE.clear()
+        info = SearchInfo()
+        stats = SearchStats()
+        board = [[_, X, _], [_, _, O], [_, _, _]]
+        move = minimax(board, info=info, hooks=stats)
+        self.assertEqual(minimax(board), move)
+        self.assertEqual(info.nodes, stats.nodes)
+        self.assertEqual(1, stats.nodes_per_ply[0])
+        self.assertGreater(stats.cutoffs, 0)
+        self.assertGreater(stats.terminal_hits + stats.table_hits, 0)
+        self.assertEqual(1, len(stats.ply_times))
+
+    def test_iterations(self):
+        stats = SearchStats()
+        minimax(initial_state(4), max_nodes=3000, hooks=stats)
+        depths = [depth for depth, _seconds in stats.ply_times]
+        self.assertEqual(list(range(1, len(depths) + 1)), depths)
+        self.assertEqual(len(depths), len(stats.as_dict()["ply_times"]))
+
+    def test_custom_hooks(self):
+        class Tracer(SearchHooks):
+            def __init__(self):
+                self.plies = []
+
+            def node(self, state, ply):
+                self.plies.append(ply)
+
+        tracer = Tracer()
+        minimax([[X, X, _], [O, O, _], [_, _, _]], hooks=tracer)
+        self.assertEqual(0, tracer.plies[0])
+        self.assertEqual(1, tracer.plies.count(0))
+
+
+class TestTournament(unittest.TestCase):
+    def test_seeded_games_repeat(self):
+        first = list(tournament.tournament(["random", "noisy:0.5"], 3, processes=1, seed=7))
+        again = list(tournament.tournament(["random", "noisy:0.5"], 3, processes=1, seed=7))
+        for record in first + again:
+            record.pop("seconds")
+        self.assertEqual(first, again)
+        self.assertEqual(6, len(first))
+
+    def test_mcts_players_repeat(self):
+        players = ["mcts:20", "mcts:200"]
+        first = list(tournament.tournament(players, 2, processes=1, size=4, seed=3))
+        # Searches outside the tournament leave the players' own trees alone
+        minimax(initial_state(4), engine="mcts", iterations=500)
+        again = list(tournament.tournament(players, 2, processes=1, size=4, seed=3))
+        self.assertEqual([record["moves"] for record in first],
+                         [record["moves"] for record in again])
+
+    def test_minimax_never_loses(self):
+        records = list(tournament.tournament(["minimax", "random"], 5, processes=1))
+        scores = tournament.summarize(records)
+        self.assertEqual(0, scores[("minimax", "random")][2])
+        self.assertEqual(0, scores[("random", "minimax")][0])
+
+    def test_pool(self):
+        records = list(tournament.tournament(["random"], 4, processes=2))
+        self.assertEqual([0, 1, 2, 3], sorted(record["game"] for record in records))
+
+    def test_unknown_player(self):
+        with self.assertRaises(ValueError):
+            list(tournament.tournament(["perfect"], 1, processes=1))
+
+
+class TestServer(unittest.TestCase):
+    def ask(self, requests, **options):
+        async def run():
+            executor = concurrent.futures.ThreadPoolExecutor(2)
+            move_server = server.MoveServer(executor, **options)
+            listener = await move_server.start("127.0.0.1", 0)
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            replies = []
+            for request in requests:
+                line = request if isinstance(request, bytes) else json.dumps(request).encode()
+                writer.write(line + b"\n")
+                replies.append(json.loads(await reader.readline()))
+            writer.close()
+            await writer.wait_closed()
+            listener.close()
+            await move_server.wait_disconnected()
+            move_server.close()
+            return replies
+        return asyncio.run(run())
+
+    def test_moves_and_cache(self):
+        board = [[_, X, _], [_, _, O], [_, _, _]]
+        first, second, stats = self.ask([{"id": 1, "board": board}, {"id": 2, "board": board},
+                                         {"stats": True}])
+        self.assertEqual(list(minimax(board)), first["move"])
+        self.assertEqual(1, first["value"])
+        self.assertEqual((1, False), (first["id"], first["cached"]))
+        self.assertTrue(second["cached"])
+        self.assertEqual(1, stats["hits"])
+
+    def test_errors(self):
+        board = initial_state()
+        replies = self.ask([b"not json", {"board": [[X, X], [_, _]]}, {"board": [[X]] * 3},
+                            {"board": board, "k": 4}])
+        self.assertTrue(all("error" in reply for reply in replies))
+        large, = self.ask([{"board": initial_state(10)}], max_size=9)
+        self.assertEqual("board must be at most 9x9", large["error"])
+
+    def test_backpressure_and_timeout(self):
+        busy, = self.ask([{"board": initial_state()}], max_pending=0)
+        self.assertEqual("busy", busy["error"])
+        slow, = self.ask([{"board": initial_state(5)}], timeout=0.01)
+        self.assertEqual("timeout", slow["error"])
+
+    def test_unsolved_boards(self):
+        board = initial_state(5)
+        move_time = tictactoe.MOVE_TIME
+        tictactoe.MOVE_TIME = 0.05
+        try:
+            first, second = self.ask([{"board": board}, {"board": board}])
+        finally:
+            tictactoe.MOVE_TIME = move_time
+        self.assertIsNone(first["value"])
+        self.assertIn(tuple(first["move"]), actions(board))
+        # A move found under a time limit is not cached as solved
+        self.assertFalse(second["cached"])
+
+    def test_lru(self):
+        cache = server.LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(1, cache.get("a"))
+
+
+class TestMCTS(unittest.TestCase):
+    def test_tactics(self):
+        win = [[X, X, _], [O, O, _], [_, _, _]]
+        block = [[X, O, X], [_, O, _], [_, _, _]]
+        self.assertEqual((0, 2), minimax(win, engine="mcts", iterations=2000))
+        self.assertEqual((2, 1), minimax(block, engine="mcts", iterations=2000))
+
+    def test_info(self):
+        info = SearchInfo()
+        move = minimax([[X, X, _], [O, O, _], [_, _, _]], engine="mcts", iterations=500,
+                       info=info)
+        self.assertEqual(move, info.move)
+        self.assertEqual(500, info.nodes)
+        self.assertGreater(info.score, 0.9)
+
+    def test_time_limit(self):
+        move = minimax(initial_state(6), engine="mcts", time_limit=0.1)
+        self.assertIn(move, actions(initial_state(6)))
+
+    def test_tree_reuse(self):
+        board = initial_state(5)
+        move = minimax(board, engine="mcts", iterations=3000)
+        board = result(board, move)
+        reply = mcts.tree_for(board.geometry).best().children[0].cell
+        board = result(board, divmod(reply, 5))
+        minimax(board, engine="mcts", iterations=10)
+        self.assertGreater(mcts.tree_for(board.geometry).root.visits, 10)
+
+    def test_own_tree(self):
+        board = initial_state(4)
+        tree = mcts.MCTS(board.geometry)
+        first = minimax(board, engine="mcts", iterations=300, seed=5, mcts_tree=tree)
+        self.assertEqual(300, tree.root.visits)
+        self.assertEqual(first, minimax(board, engine="mcts", iterations=300, seed=5,
+                                        mcts_tree=mcts.MCTS(board.geometry)))
+        with self.assertRaises(ValueError):
+            minimax(initial_state(), engine="mcts", mcts_tree=tree)
+        with self.assertRaises(ValueError):
+            minimax(board, seed=5)
+
+    def test_root_parallel(self):
+        move = minimax([[X, X, _], [O, O, _], [_, _, _]], engine="mcts", iterations=2000,
+                       processes=2)
+        self.assertEqual((0, 2), move)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            minimax(initial_state(), engine="perfect")
+
+
+class TestParallelSearch(unittest.TestCase):
+    positions = [
+        initial_state(),
+        [[X, _, _], [_, _, _], [_, _, _]],
+        [[_, X, _], [_, _, O], [_, _, _]],
+        [[X, _, O], [_, _, _], [_, _, _]],
+        [[X, _, _], [_, O, _], [_, _, X]],
+        [[_, _, _], [X, O, O], [_, X, _]],
+    ]
+
+    def test_same_moves(self):
+        for board in self.positions:
+            info = SearchInfo()
+            self.assertEqual(minimax(board), minimax(board, processes=2, info=info))
+            self.assertTrue(info.completed)
+
+    def test_time_limit(self):
+        info = SearchInfo()
+        started = time.perf_counter()
+        move = minimax(initial_state(5), time_limit=0.3, processes=2, info=info)
+        # A bound loose enough for a loaded machine; info shows the budget ran out
+        self.assertLess(time.perf_counter() - started, 2.0)
+        self.assertIn(move, actions(initial_state(5)))
+        self.assertGreaterEqual(info.depth, 1)
+        self.assertFalse(info.completed)
+        self.assertIsNone(info.value)
+
+    def test_shutdown(self):
+        board = self.positions[1]
+        minimax(board, processes=2)
+        minimax(board, engine="mcts", iterations=200, processes=2)
+        self.assertEqual({("parallel", 2), ("mcts", 2)}, set(pools._pools))
+        pools.shutdown()
+        self.assertEqual({}, pools._pools)
+        # A later search starts its pool again
+        self.assertEqual(minimax(board), minimax(board, processes=2))
+
+    def test_options(self):
+        with self.assertRaises(ValueError):
+            minimax(initial_state(), processes=2, max_nodes=100)
+        with self.assertRaises(ValueError):
+            minimax(initial_state(), processes=2, record_tree=True)
+
+
+class TestTreeExport(unittest.TestCase):
+    def setUp(self):
+        TRANSPOSITION_TABLE.clear()
+        _move, self.tree = minimax([[_, X, _], [_, _, O], [_, _, _]], record_tree=True)
+        self.paths = []
+
+    def tearDown(self):
+        for path in self.paths:
+            os.remove(path)
+
+    def export(self, suffix, **limits):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        os.close(handle)
+        self.paths.append(path)
+        return path, treeio.export(self.tree, path, **limits)
+
+    def assertSameNodes(self, expected, actual):
+        self.assertEqual((expected.name, expected.action, expected.result, expected.score),
+                         (actual.name, actual.action, actual.result, actual.score))
+        self.assertEqual(len(expected.children), len(actual.children))
+        for expected_child, actual_child in zip(expected.children, actual.children):
+            self.assertSameNodes(expected_child, actual_child)
+
+    def test_round_trip(self):
+        for suffix in (".jsonl", ".bin"):
+            path, count = self.export(suffix)
+            with treeio.TreeReader(path) as reader:
+                self.assertEqual(len(self.tree), count)
+                self.assertEqual(count, len(reader))
+                self.assertEqual([self.tree.cells[child] for child in self.tree.children(0)],
+                                 [child.cell for child in reader.children(reader.root())])
+                self.assertSameNodes(self.tree.to_node(), reader.to_node())
+
+    def test_limits(self):
+        path, count = self.export(".bin", max_depth=1)
+        with treeio.TreeReader(path) as reader:
+            self.assertEqual(1 + len(self.tree.children(0)), count)
+            self.assertTrue(any(node.truncated for node in reader))
+        path, count = self.export(".jsonl", max_nodes=5)
+        with treeio.TreeReader(path) as reader:
+            self.assertEqual(5, count)
+            self.assertEqual(5, reader.root().size)
+            # Nodes that lost children to the limit are flagged, the others not
+            indices = [index for index, _depth, _truncated
+                       in treeio.walk(self.tree, max_nodes=5)]
+            for node in reader:
+                exported = len(list(reader.children(node)))
+                self.assertEqual(exported < len(self.tree.children(indices[node.position])),
+                                 node.truncated)
+            self.assertTrue(reader.root().truncated)
+
+    def test_streaming(self):
+        chunks = treeio.records(self.tree, "jsonl")
+        header = json.loads(next(chunks))
+        self.assertEqual(len(self.tree), header["count"])
+        self.assertEqual(-1, json.loads(next(chunks))["cell"])
+
+
+class TestNode(unittest.TestCase):
+    def test_depth_and_path(self):
+        root = Node("X")
+        child = Node("0X", parent=root)
+        grandchild = Node("0O", parent=child)
+        self.assertEqual((0, 1, 2), (root.depth, child.depth, grandchild.depth))
+        self.assertEqual("X/0X/0O", grandchild.path)
+        self.assertIs(grandchild, root.find("0X/0O"))
+        self.assertIsNone(root.find("0X/1O"))
+        self.assertEqual("- X (depth: 0)\n  - 0X (depth: 1)\n    - 0O (depth: 2)\n", str(root))
+
+    def test_moved_subtree(self):
+        child = Node("0X", parent=Node("X"))
+        grandchild = Node("0O", parent=child)
+        self.assertEqual("X/0X/0O", grandchild.path)
+        new_root = Node("O")
+        Node("1O", parent=new_root).add_child(child)
+        self.assertEqual((2, 3), (child.depth, grandchild.depth))
+        self.assertEqual("O/1O/0X/0O", grandchild.path)
+
+    def test_deep_chain(self):
+        root = node = Node("0")
+        for i in range(1, 5000):
+            node = Node(str(i), parent=node)
+        self.assertEqual(4999, node.depth)
+        self.assertTrue(node.path.endswith("/4998/4999"))
+        self.assertEqual(5000, sum(1 for _node in root.walk()))
+
+
+class TestBoardState(unittest.TestCase):
+    def test_result_keeps_state(self):
+        rng = random.Random(3)
+        for _game in range(20):
+            board = initial_state()
+            while not terminal(board):
+                board = result(board, rng.choice(sorted(actions(board))))
+                self.assertEqual(GameState.from_board([list(row) for row in board]),
+                                 board.state())
+
+    def test_writes_forget_state(self):
+        board = result(initial_state(), (0, 0))
+        self.assertEqual(O, player(board))
+        board[1][1] = O
+        self.assertEqual(X, player(board))
+        board[2] = [X, X, X]
+        self.assertEqual(X, winner(board))
+        board[2][0] = _
+        self.assertIsNone(winner(board))
+        board[2].clear()
+        board[2].extend([_, _, _])
+        self.assertEqual(7, len(actions(board)))
+
+    def test_pickle(self):
+        board = result(result(initial_state(), (0, 0)), (1, 1))
+        copied = pickle.loads(pickle.dumps(board))
+        self.assertEqual(board, copied)
+        copied[0][2] = X
+        self.assertEqual(X, player(board))
+        self.assertEqual(O, player(copied))
+
+
+class TestGameRecords(unittest.TestCase):
+    games = [
+        [(1, 1), (0, 0), (0, 1), (2, 1), (0, 2), (2, 0), (1, 0), (1, 2), (2, 2)],
+        [(0, 0), (1, 1), (0, 1), (2, 2), (0, 2)],
+        [(0, 1), (0, 0), (0, 2), (1, 1), (1, 0), (2, 2)],
+        [(1, 1), (0, 0)],
+    ]
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".ttg")
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write(self, hashes=False):
+        with records.RecordWriter(self.path, hashes=hashes) as writer:
+            for game in self.games:
+                writer.write(game)
+
+    def test_round_trip(self):
+        for hashes in (False, True):
+            self.write(hashes)
+            with records.RecordReader(self.path) as reader:
+                read = list(reader)
+            self.assertEqual([records.encode(game, hashes=hashes) for game in self.games], read)
+            self.assertEqual(self.games, [record.actions(get_geometry(3)) for record in read])
+            self.assertEqual([0, 1, -1, 0], [record.result for record in read])
+
+    def test_replay(self):
+        record = records.encode(self.games[1], hashes=True)
+        boards = list(records.replay(record))
+        self.assertEqual(5, len(boards))
+        self.assertEqual(X, winner(boards[-1]))
+        self.assertEqual([GameState.from_board(board).packed() for board in boards],
+                         list(record.hashes))
+
+    def test_illegal_games(self):
+        with self.assertRaises(ValueError):
+            records.encode([(0, 0), (0, 0)])
+        with self.assertRaises(ValueError):
+            records.encode(self.games[1] + [(2, 2)])
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_summary(self):
+        self.write()
+        summary = records.summary(self.path)
+        self.assertEqual((4, 1, 1, 2), (summary["games"], summary["x_wins"], summary["o_wins"],
+                                        summary["draws"]))
+        self.assertEqual(2, summary["first_moves"][4])
+        self.assertEqual(1, summary["lengths"][9])
+
+    def test_convert(self):
+        handle, source = tempfile.mkstemp(suffix=".jsonl")
+        with os.fdopen(handle, "w") as lines:
+            for game in self.games:
+                lines.write(json.dumps({"size": 3, "k": 3, "moves": game}) + "\n")
+        try:
+            self.assertEqual(4, records.convert(source, self.path))
+        finally:
+            os.remove(source)
+        with records.RecordReader(self.path) as reader:
+            self.assertEqual(self.games[1], list(reader)[1].actions(get_geometry(3)))
+
+
+class TestOpeningBook(unittest.TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".bin")
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_build_and_load(self):
+        opening = book.OpeningBook.build(3, max_ply=3, games=20, seed=1)
+        opening.save(self.path)
+        loaded = book.OpeningBook.load(self.path)
+        self.assertEqual(opening.entries, loaded.entries)
+        self.assertEqual(0, loaded.lookup(GameState())[0])
+        solved = solutions.solve()
+        for x, o in solved:
+            state = GameState(x, o)
+            entry = loaded.lookup(state)
+            if entry is not None:
+                value, action, distance = entry
+                self.assertEqual(solved[(x, o)][0], value)
+                self.assertEqual(solved[(x, o)][2], distance)
+                state.push(action[0] * 3 + action[1])
+                self.assertEqual(value, solved[(state.x, state.o)][0])
+
+    def test_book_in_front_of_minimax(self):
+        opening = book.OpeningBook.build(3, max_ply=1, games=1)
+        cache = book.PositionCache(opening)
+        info = SearchInfo()
+        self.assertEqual(opening.lookup(GameState())[1],
+                         minimax(initial_state(), table=cache, info=info))
+        self.assertTrue(info.completed)
+        self.assertEqual((1, 0, 0), (cache.book_hits, cache.hits, cache.misses))
+
+
+class TestPositionCache(unittest.TestCase):
+    board = [[X, O, X],
+             [_, O, _],
+             [_, _, _]]
+
+    def test_stores_finished_searches(self):
+        cache = book.PositionCache()
+        move = minimax(self.board, table=cache)
+        self.assertEqual((1, 1), (len(cache), cache.misses))
+        info = SearchInfo()
+        self.assertEqual(move, minimax(self.board, table=cache, info=info))
+        self.assertEqual(1, cache.hits)
+        self.assertEqual((0, 5, 0), (info.value, info.distance, info.depth))
+        # A reflection of the position is the same entry
+        mirrored = [list(reversed(row)) for row in self.board]
+        self.assertEqual((move[0], 2 - move[1]), minimax(mirrored, table=cache))
+        self.assertEqual(2, cache.hits)
+
+    def test_budgeted_searches_are_not_stored(self):
+        cache = book.PositionCache()
+        minimax(initial_state(5), table=cache, max_nodes=500)
+        self.assertEqual(0, len(cache))
+
+    def test_memory_cap(self):
+        cache = book.PositionCache(max_bytes=2000)
+        rng = random.Random(3)
+        for _game in range(20):
+            board = initial_state()
+            while not terminal(board):
+                minimax(board, table=cache)
+                board = result(board, rng.choice(sorted(actions(board))))
+            self.assertLessEqual(cache.bytes, cache.max_bytes)
+        self.assertGreater(cache.evictions, 0)
+        self.assertEqual(cache.stats()["cached"], len(cache))
+
+    def test_max_empties(self):
+        cache = book.PositionCache(max_empties=5)
+        minimax(initial_state(), table=cache)
+        minimax(self.board, table=cache)
+        self.assertEqual(1, len(cache))
+
+
+class TestUltimate(unittest.TestCase):
+    def test_grid(self):
+        self.assertEqual(81, len(set(ultimate.GRID)))
+        self.assertEqual((4, 4), ultimate.GRID[40])
+        self.assertEqual((0, 8), ultimate.GRID[20])
+        self.assertEqual(81, len(ultimate.initial_state().actions()))
+
+    def test_send_to_board(self):
+        state = ultimate.result(ultimate.initial_state(), (1, 1))
+        self.assertEqual(4, state.target)
+        self.assertEqual({(i, j) for i in range(3, 6) for j in range(3, 6)}, state.actions())
+
+    def test_decided_board_frees_the_move(self):
+        state = ultimate.initial_state()
+        for move in (0, 40, 1, 50, 2):
+            state.push(move)
+        self.assertEqual((1, 0), (state.x_boards, state.o_boards))
+        self.assertEqual(2, state.target)
+        # Sent to the board X has won: any cell of another open board
+        state.push(18)
+        self.assertEqual(-1, state.target)
+        self.assertEqual(81 - 9 - 3, len(state.moves()))
+        state.pop(18)
+        state.pop(2)
+        self.assertEqual((0, 5), (state.x_boards, state.target))
+
+    def test_meta_board_win(self):
+        state = ultimate.initial_state()
+        for move in (0, 40, 1, 50, 2, 41, 9, 51, 10, 42, 11, 52, 18, 60, 19, 61):
+            state.push(move)
+        self.assertFalse(state.terminal())
+        state.push(20)
+        self.assertEqual((X, 1, 0b111), (state.won, state.utility(), state.x_boards))
+        self.assertTrue(state.terminal())
+        self.assertEqual(set(), state.actions())
+
+    def test_illegal_moves(self):
+        state = ultimate.UltimateState.from_moves([(1, 1)])
+        with self.assertRaises(ValueError):
+            ultimate.result(state, (0, 0))
+        with self.assertRaises(ValueError):
+            ultimate.UltimateState.from_moves([(1, 1), (0, 1)])
+
+    def test_choose_wins(self):
+        state = ultimate.initial_state()
+        for move in (0, 40, 1, 50, 2, 41, 9, 51, 10, 42, 11, 52, 18, 60, 19):
+            state.push(move)
+        state.push(56)
+        state.target = 2
+        info = SearchInfo()
+        self.assertEqual((0, 8), ultimate.choose(state, info=info))
+        self.assertEqual((1, True), (info.value, info.completed))
+
+    def test_budget(self):
+        state = ultimate.UltimateState.from_moves([(4, 4), (3, 3)])
+        info = SearchInfo()
+        started = time.perf_counter()
+        action = ultimate.choose(state, time_limit=0.05, info=info)
+        # A bound loose enough for a loaded machine; info shows the budget ran out
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertIn(action, state.actions())
+        self.assertGreaterEqual(info.depth, 1)
+        self.assertFalse(info.completed)
+        info = SearchInfo()
+        self.assertIn(ultimate.choose(state, max_nodes=50, info=info), state.actions())
+        self.assertLessEqual(info.nodes, 50)
+        self.assertFalse(info.completed)
+
+
+class TestDifferential(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.reference = solutions.solve()
+
+    def test_engines_agree(self):
+        engines = ["minimax", "minimax-budget", "minimax-tree", "position-cache", "solve-many",
+                   "solution-table"]
+        results = differential.run(engines, self.reference)
+        self.assertEqual(engines, list(results))
+        for name, found in results.items():
+            self.assertEqual([], found["mismatches"], name)
+            self.assertEqual(4520, found["positions"])
+            self.assertGreater(found["per_second"], 0)
+
+    def test_slow_wins_are_caught(self):
+        reference = self.reference
+
+        def slowest():
+            def solve(board):
+                # Right value, but the longest way to it
+                state = GameState.from_board(board)
+                value = reference[(state.x, state.o)][0]
+                options = []
+                for i, j in state.actions():
+                    state.push(i * 3 + j)
+                    child_value, _, distance = reference[(state.x, state.o)]
+                    state.pop(i * 3 + j)
+                    if child_value == value:
+                        options.append((distance, (i, j)))
+                return max(options)[1], value, None
+            return solve
+
+        mismatches = differential.run({"slowest": slowest}, reference)["slowest"]["mismatches"]
+        self.assertTrue(mismatches)
+        self.assertEqual({"move"}, {mismatch.field for mismatch in mismatches})
+        self.assertTrue(all(mismatch.expected[0] != 0 for mismatch in mismatches))
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_corpus(self):
+        boards = benchmark.corpus()
+        self.assertEqual(1 + 9 + 9 * 8 + len(benchmark.TACTICAL), len(boards))
+        self.assertFalse(any(terminal(board) for board in boards))
+
+    def test_measure(self):
+        measured = benchmark.measure(benchmark.CONFIGURATIONS["minimax"], benchmark.TACTICAL, 1)
+        self.assertGreater(measured["nodes"], 0)
+        self.assertGreater(measured["peak_kib"], 0)
+
+    def test_compare(self):
+        baseline = {"results": {"minimax": {"wall_s": 1.0, "nodes": 100}}}
+        same = {"results": {"minimax": {"wall_s": 1.05, "nodes": 100}}}
+        slower = {"results": {"minimax": {"wall_s": 1.5, "nodes": 100}}}
+        wider = {"results": {"minimax": {"wall_s": 1.0, "nodes": 101}}}
+        self.assertEqual([], benchmark.compare(same, baseline))
+        self.assertEqual(1, len(benchmark.compare(slower, baseline)))
+        self.assertEqual(1, len(benchmark.compare(wider, baseline)))
+
+
 class TestMinMax(unittest.TestCase):
     def test_tictactoe_is_a_draw(self):
         board = initial_state()
@@ -0,0 +1,94 @@
+"""
+Winner, terminal and utility over many boards at once with NumPy.
+
+Boards come either as an (n, size, size) integer array holding 1 for X, -1
+for O and 0 for empty cells, or as a 1-D integer array of packed bitboards
+(GameState.packed(): x | o << cells). Each function returns one value per
+board, matching the scalar functions in tictactoe.py.
+"""
+
+import numpy as np
+
+import tictactoe as ttt
+
+X_CELL = 1
+O_CELL = -1
+
+_LINE_INDICES = {}
+
+
+def line_indices(geometry=ttt.DEFAULT_GEOMETRY):
+    """(lines, k) array with the flat cell indices of every winning line"""
+    indices = _LINE_INDICES.get(geometry)
+    if indices is None:
+        indices = np.array(
+            [[cell for cell in range(geometry.cells) if mask >> cell & 1]
+             for mask in geometry.win_masks],
+            dtype=np.intp,
+        )
+        _LINE_INDICES[geometry] = indices
+    return indices
+
+
+def to_array(boards):
+    """Convert list-of-lists boards to an (n, size, size) int8 array"""
+    codes = {ttt.X: X_CELL, ttt.O: O_CELL}
+    return np.array(
+        [[[codes.get(cell, 0) for cell in row] for row in board] for board in boards],
+        dtype=np.int8,
+    )
+
+
+def as_cells(boards, geometry=None):
+    """
+    Returns (cells, geometry): an (n, cells) int8 array of the boards and
+    their geometry. geometry is required for boards with a line length other
+    than the default, and for packed boards that are not 3x3.
+    """
+    boards = np.asarray(boards)
+    if boards.ndim == 3:
+        if geometry is None:
+            geometry = ttt.get_geometry(boards.shape[1])
+        return boards.reshape(len(boards), -1).astype(np.int8, copy=False), geometry
+    if boards.ndim != 1 or not np.issubdtype(boards.dtype, np.integer):
+        raise ValueError("Expected an (n, size, size) array or a 1-D array of packed boards")
+    if geometry is None:
+        geometry = ttt.DEFAULT_GEOMETRY
+    packed = boards.astype(np.uint64, copy=False)[:, None]
+    shifts = np.arange(geometry.cells, dtype=np.uint64)
+    x = (packed >> shifts) & np.uint64(1)
+    o = (packed >> (shifts + np.uint64(geometry.cells))) & np.uint64(1)
+    return (x.astype(np.int8) - o.astype(np.int8)), geometry
+
+
+def classify(boards, geometry=None):
+    """
+    Returns (winner, draw, value) arrays in one pass over the lines: winner
+    is 1 for X, -1 for O and 0 for nobody, draw is True for full boards
+    without a winner and value is the utility of each board.
+
+    As in tictactoe.winner, X is reported when both players own a line.
+    """
+    cells, geometry = as_cells(boards, geometry)
+    sums = cells[:, line_indices(geometry)].sum(axis=2, dtype=np.int16)
+    x_wins = (sums == geometry.k).any(axis=1)
+    o_wins = (sums == -geometry.k).any(axis=1)
+    winners = np.where(x_wins, X_CELL, np.where(o_wins, O_CELL, 0)).astype(np.int8)
+    full = (cells != 0).all(axis=1)
+    return winners, full & (winners == 0), winners.copy()
+
+
+def winner(boards, geometry=None):
+    """1 where X has won, -1 where O has won, 0 otherwise"""
+    return classify(boards, geometry)[0]
+
+
+def terminal(boards, geometry=None):
+    """True where the game is over"""
+    winners, draws, _ = classify(boards, geometry)
+    return (winners != 0) | draws
+
+
+def utility(boards, geometry=None):
+    """1 if X has won, -1 if O has won, 0 otherwise"""
+    return classify(boards, geometry)[2]